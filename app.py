@@ -1,27 +1,75 @@
 import gradio as gr
+import hashlib
+import os
 import re
+import tempfile
+import threading
+import time
 from langchain_ollama import ChatOllama
 from langchain.prompts import PromptTemplate
 from operator import itemgetter
 from database import DatabaseManager
+from index_advisor import IndexAdvisor
+from summary_tables import SummaryTableManager
 from config import OLLAMA_API_URL
 from config import OLLAMA_CHAT_MODEL
 from config import OLLAMA_CODE_MODEL
+from config import REQUEST_TIMEOUT
+from config import LLM_STAGE_TIMEOUT
+from config import MYSQL_MAX_EXECUTION_TIME
+from config import INGEST_MODE
+from config import SCHEMA_EVOLUTION
+from config import SCHEMA_EVOLUTION_MIN_OVERLAP
+from config import SCHEMA_EVOLUTION_MIN_SHARED_COLUMNS
+from config import SUMMARY_TABLE_MIN_HITS
+from config import QUERY_CACHE_TTL
+from config import CHATDB_WORKERS
+from config import CHATDB_WORKER_ID
+from config import SERVER_PORT
+from config import WORKER_BASE_PORT
+from config import BATCH_CONCURRENCY
+from config import BATCH_MAX_CONCURRENCY
+from batch import load_questions
+from batch import run_batch
+from shared_store import get_shared_store
+from cancellation import QueryCancelled
+from cancellation import QueryTimeout
+from cancellation import start_request
+from cancellation import finish_request
+from cancellation import cancel_session
 from logger import get_logger
 
 logger = get_logger()
 
+# 当前线程中stream_chain正在读取的Ollama响应
+_llm_streams = threading.local()
+
+def track_llm_response(response):
+    """httpx响应钩子：记录正在读取的Ollama流式响应，取消时可直接断开"""
+    current = getattr(_llm_streams, "current", None)
+    if current is not None:
+        current["response"] = response
+
+def close_llm_response(current):
+    """取消回调：关闭正在读取的响应，断开到Ollama的HTTP连接，Ollama随之停止生成"""
+    response = current.get("response")
+    if response is not None:
+        response.close()
+        logger.info("Closed in-flight LLM response")
+
 # Initialize ChatOllama for chat responses
 llm = ChatOllama(
     base_url=OLLAMA_API_URL,
     model=OLLAMA_CHAT_MODEL,
-    temperature=0
+    temperature=0,
+    client_kwargs={"timeout": LLM_STAGE_TIMEOUT or None, "event_hooks": {"response": [track_llm_response]}}
 )
 # Initialize ChatOllama for code responses
 code_llm = ChatOllama(
     base_url=OLLAMA_API_URL,
     model=OLLAMA_CODE_MODEL,
-    temperature=0
+    temperature=0,
+    client_kwargs={"timeout": LLM_STAGE_TIMEOUT or None, "event_hooks": {"response": [track_llm_response]}}
 )
 
 def format_llm_response(response):
@@ -35,6 +83,66 @@ def format_llm_response(response):
     else:
         return str(response)
 
+def stream_chain(chain, input_data, scope, timeout=LLM_STAGE_TIMEOUT):
+    """流式调用chain，超出阶段时间预算或请求被取消时中止"""
+    deadline = time.monotonic() + timeout if timeout else None
+    scope.check(deadline)
+    # 取消时直接关闭进行中的HTTP响应，不必等到下一个chunk才退出（同数据库查询的KILL QUERY）
+    current = {}
+    _llm_streams.current = current
+    handle = scope.add_callback(lambda: close_llm_response(current))
+    stream = chain.stream(input_data)
+    try:
+        for chunk in stream:
+            scope.check(deadline)
+            yield format_llm_response(chunk)
+        scope.check(deadline)
+    except Exception:
+        # 响应被取消回调关闭后读取会报错，统一转换为取消/超时
+        scope.check(deadline)
+        raise
+    finally:
+        scope.remove_callback(handle)
+        _llm_streams.current = None
+        # 关闭流会断开到Ollama的HTTP连接，Ollama随之停止生成
+        stream.close()
+
+def invoke_chain(chain, input_data, scope, timeout=LLM_STAGE_TIMEOUT):
+    """调用chain并返回完整文本，带阶段超时和取消"""
+    return "".join(stream_chain(chain, input_data, scope, timeout))
+
+def record_metric(name, seconds=None):
+    """累加共享指标（所有worker汇总）：次数及可选的耗时"""
+    store = get_shared_store()
+    store.incr("metrics", f"{name}_count")
+    if seconds is not None:
+        store.incr("metrics", f"{name}_seconds", seconds)
+
+def record_stage(stats, name, started):
+    """记录阶段耗时到共享指标，并累加到本次请求的stats["timings"]"""
+    elapsed = time.monotonic() - started
+    record_metric(name, elapsed)
+    if stats is not None:
+        timings = stats.setdefault("timings", {})
+        timings[name] = round(timings.get(name, 0.0) + elapsed, 3)
+
+def get_metrics():
+    """汇总指标，包含各阶段平均耗时"""
+    metrics = get_shared_store().counters("metrics")
+    for name in [key[:-len("_seconds")] for key in metrics if key.endswith("_seconds")]:
+        count = metrics.get(f"{name}_count")
+        if count:
+            metrics[f"{name}_avg_seconds"] = round(metrics[f"{name}_seconds"] / count, 3)
+    return dict(sorted(metrics.items()))
+
+def query_time_budget(scope):
+    """生成SQL的MAX_EXECUTION_TIME（毫秒），不超过请求剩余时间"""
+    remaining = scope.remaining()
+    if remaining is None:
+        return MYSQL_MAX_EXECUTION_TIME
+    remaining_ms = max(1, int(remaining * 1000))
+    return min(MYSQL_MAX_EXECUTION_TIME, remaining_ms) if MYSQL_MAX_EXECUTION_TIME else remaining_ms
+
 # Create prompt template for determining if database query is needed
 need_db_prompt = PromptTemplate(
     input_variables=["question", "schema"],
@@ -109,6 +217,18 @@ answer_chain = (
 # Initialize database manager
 db_manager = DatabaseManager()
 
+# 根据生成SQL的工作负载推荐索引
+index_advisor = IndexAdvisor()
+db_manager.query_observers.append(index_advisor.record)
+
+# 高频聚合查询的物化汇总表
+summary_tables = SummaryTableManager()
+if SUMMARY_TABLE_MIN_HITS > 0:
+    summary_tables.ensure_registry()
+    db_manager.query_rewriters.append(summary_tables.rewrite)
+    db_manager.query_observers.append(summary_tables.record)
+    db_manager.write_observers.append(summary_tables.on_write)
+
 def get_schema(db_type):
     """Get database schema based on type"""
     return db_manager.get_mysql_schema()
@@ -134,24 +254,56 @@ def table_creation_prompt(query):
             "message": f"Table {table_name} created successfully"
         }
 
-def process_query(question, db_type):
+def process_query(question, db_type, request: gr.Request = None):
+    # Gradio会话标识，用于read-your-writes路由和取消
+    session = request.session_hash if request else None
+    yield from run_pipeline(question, db_type, session=session)
+
+def run_pipeline(question, db_type, session=None, stats=None, cache_namespace=""):
+    """问答流程：判断是否需要查询数据库、生成并执行SQL、流式生成答案
+
+    依次产出(是否需要查询数据库, SQL, 答案)。stats不为None时记录各阶段耗时（timings，秒）、
+    缓存命中（cache_hits）、SQL执行次数（sql_attempts）和重试耗尽后的SQL错误（query_error）。
+    判断结果和SQL只在同一cache_namespace内共享缓存（默认为所有界面请求共用），为None时不使用缓存。
+    """
     logger.info(f"Processing query - Question: {question}, DB Type: {db_type}")
+    scope = start_request(session, REQUEST_TIMEOUT)
+    store = get_shared_store()
+    record_metric("questions")
     try:
         # Get schema first since we need it for both determination and query
         logger.info("Fetching database schema")
+        started = time.monotonic()
         schema = get_schema(db_type)
+        record_stage(stats, "schema", started)
         if not schema:
             logger.info("Failed to get database schema")
             yield "需要数据库Schema", "", "Failed to get database schema"
             return
 
+        # 相同问题和schema的判断结果与SQL在所有worker间共享缓存
+        use_cache = bool(QUERY_CACHE_TTL) and cache_namespace is not None
+        cache_key = hashlib.sha256(
+            f"{cache_namespace}\n{db_type}\n{question.strip()}\n{schema}".encode("utf-8")
+        ).hexdigest()
+
         # First determine if database query is needed
         logger.info("Determining if database query is needed")
-        need_db_response = format_llm_response(need_db_chain.invoke({
-            "question": question,
-            "schema": schema
-        }))
-        needs_db = need_db_response.strip().lower() == "true"
+        needs_db = store.get("need_db", cache_key) if use_cache else None
+        if needs_db is None:
+            started = time.monotonic()
+            need_db_response = invoke_chain(need_db_chain, {
+                "question": question,
+                "schema": schema
+            }, scope)
+            record_stage(stats, "need_db", started)
+            needs_db = need_db_response.strip().lower() == "true"
+            if use_cache:
+                store.set("need_db", cache_key, needs_db, ttl=QUERY_CACHE_TTL)
+        else:
+            record_metric("need_db_cache_hits")
+            if stats is not None:
+                stats.setdefault("cache_hits", []).append("need_db")
         need_db_text = "需要查询数据库" if needs_db else "不需要查询数据库"
         
         if not needs_db:
@@ -170,26 +322,37 @@ def process_query(question, db_type):
             if not isinstance(input_data, dict) or "question" not in input_data or "data" not in input_data:
                 raise ValueError("Invalid input data format for answer_chain")
                 
-            for chunk in answer_chain.stream(input_data):
-                answer += format_llm_response(chunk)
+            started = time.monotonic()
+            for chunk in stream_chain(answer_chain, input_data, scope):
+                answer += chunk
                 yield need_db_text, "无需SQL查询", [(None, answer)]
+            record_stage(stats, "answer", started)
             return
         
         # If database query is needed, proceed with query generation
         logger.info("Database query needed, proceeding with query generation")
             
-        # Generate SQL query
-        response = format_llm_response(sql_chain.invoke({
-            "question": question,
-            "db_type": db_type,
-            "schema": schema
-        }))
-
-        logger.info(f"SQL generate chain result: {response}")
-        
-        # Extract SQL query
         from sql_utils import extract_sql
-        sql_response = extract_sql(response)
+        sql_response = store.get("sql", cache_key) if use_cache else None
+        if sql_response:
+            logger.info(f"SQL cache hit: {sql_response}")
+            record_metric("sql_cache_hits")
+            if stats is not None:
+                stats.setdefault("cache_hits", []).append("sql")
+        else:
+            # Generate SQL query
+            started = time.monotonic()
+            response = invoke_chain(sql_chain, {
+                "question": question,
+                "db_type": db_type,
+                "schema": schema
+            }, scope)
+            record_stage(stats, "sql_generation", started)
+
+            logger.info(f"SQL generate chain result: {response}")
+            
+            # Extract SQL query
+            sql_response = extract_sql(response)
         
         # Initialize retry counter and error message
         retry_count = 0
@@ -200,8 +363,21 @@ def process_query(question, db_type):
             try:
                 # Execute query
                 logger.info(f"Executing query (attempt {retry_count + 1})")
-                data_str = db_manager.execute_mysql_query(sql_response)
+                if stats is not None:
+                    stats["sql_attempts"] = retry_count + 1
+                started = time.monotonic()
+                data_str = db_manager.execute_mysql_query(
+                    sql_response,
+                    session=session,
+                    cancel_scope=scope,
+                    max_execution_time=query_time_budget(scope)
+                )
+                record_stage(stats, "query", started)
+                if stats is not None:
+                    stats["query_error"] = None
                 logger.info(f"Query executed successfully result: {data_str}")
+                if use_cache:
+                    store.set("sql", cache_key, sql_response, ttl=QUERY_CACHE_TTL)
                 answer = ""
                 # Validate input data before streaming
                 if not question or not data_str:
@@ -215,13 +391,20 @@ def process_query(question, db_type):
                 if not isinstance(input_data, dict) or "question" not in input_data or "data" not in input_data:
                     raise ValueError("Invalid input data format for answer_chain")
                     
-                for chunk in answer_chain.stream(input_data):
-                    answer += format_llm_response(chunk)
+                started = time.monotonic()
+                for chunk in stream_chain(answer_chain, input_data, scope):
+                    answer += chunk
                     yield need_db_text, sql_response, [(None, answer)]
+                record_stage(stats, "answer", started)
                 return
                     
+            except QueryCancelled:
+                raise
             except Exception as e:
+                record_metric("query_errors")
                 last_error = str(e)
+                if stats is not None:
+                    stats["query_error"] = last_error
                 retry_count += 1
                 if retry_count >= max_retries:
                     logger.info(f"Max retries reached. Last error: {last_error}")
@@ -238,25 +421,51 @@ def process_query(question, db_type):
                     if not isinstance(input_data, dict) or "question" not in input_data or "data" not in input_data:
                         raise ValueError("Invalid input data format for answer_chain")
                         
-                    for chunk in answer_chain.stream(input_data):
-                        answer += format_llm_response(chunk)
+                    started = time.monotonic()
+                    for chunk in stream_chain(answer_chain, input_data, scope):
+                        answer += chunk
                         yield need_db_text, sql_response, [(None, answer)]
+                    record_stage(stats, "answer", started)
                     return
                 
                 logger.info(f"Query error (attempt {retry_count}): {last_error}")
                 # Regenerate SQL with error context
-                response = format_llm_response(sql_chain.invoke({
+                started = time.monotonic()
+                response = invoke_chain(sql_chain, {
                     "question": question,
                     "db_type": db_type, 
                     "schema": schema,
                     "error": last_error
-                }))
+                }, scope)
+                record_stage(stats, "sql_generation", started)
                 # Extract SQL query
                 sql_response = extract_sql(response)
 
+    except QueryTimeout as e:
+        record_metric("timeouts")
+        logger.info(f"Query timed out: {str(e)}")
+        yield "处理超时", "", [(None, f"Error: {str(e)}")]
+    except QueryCancelled as e:
+        logger.info(f"Query cancelled: {str(e)}")
+    except GeneratorExit:
+        # Gradio在客户端断开时关闭生成器
+        scope.cancel("client disconnected")
+        raise
     except Exception as e:
         logger.info(f"Error processing query: {str(e)}", exc_info=True)
         yield "处理出错", "", [(None, f"Error: {str(e)}")]
+    finally:
+        finish_request(session, scope)
+
+def cancel_active_query(request: gr.Request = None):
+    """提交新问题前取消该会话仍在执行的请求"""
+    if request:
+        cancel_session(request.session_hash, "superseded by a new request")
+
+def cancel_disconnected_query(request: gr.Request = None):
+    """页面关闭时取消该会话仍在执行的请求"""
+    if request:
+        cancel_session(request.session_hash, "client disconnected")
 
 # Create prompt template for table creation
 table_creation_prompt_template = PromptTemplate(
@@ -296,14 +505,48 @@ table_creation_prompt_template = PromptTemplate(
     """
 )
 
-def process_upload(file, table_name=None):
-    """Process uploaded CSV file"""
+def insert_uploaded_rows(table_name, df, session, mode, key_columns, content_hash, file_name, columns_hash):
+    """写入上传的数据并记录导入清单"""
+    # Insert data using insert_from_df which explicitly handles DataFrames
+    logger.info(f"开始插入数据到表{table_name}，写入模式：{mode}")
+    result = db_manager.insert_from_df(
+        table_name, df,
+        session=session,
+        mode=mode,
+        key_columns=key_columns,
+        source=file_name
+    )
+    
+    if result and result.get("status") == "success":
+        db_manager.record_ingested_file(
+            content_hash, file_name, table_name, columns_hash, len(df), mode
+        )
+        logger.info(f"数据写入成功：{result['message']}")
+        return (
+            f"文件上传成功，数据已写入表{table_name}："
+            f"新增{result['row_count']}行，更新{result.get('updated_count', 0)}行"
+        )
+    else:
+        logger.error(f"文件上传失败：{result.get('message') if result else ''}")
+        return "文件上传失败"
+
+def process_upload(file, table_name=None, mode=INGEST_MODE, key_columns="", evolve_schema=SCHEMA_EVOLUTION,
+                   request: gr.Request = None):
+    """Process uploaded CSV file
+
+    相同内容的文件只导入一次；mode控制写入方式（append/upsert/incremental），
+    key_columns为逗号分隔的去重键或水位列，去重更新留空时使用表的主键/唯一索引。
+    evolve_schema开启时，若所选表（未选择时为与文件名同名的表）与上传列相近，则为该表添加缺少的列，而不是新建表。
+    """
+    session = request.session_hash if request else None
     try:
         if not file:
             return "请选择要上传的文件"
             
         import pandas as pd
-        from sql_utils import create_table_from_sql, extract_sql, extract_table_name
+        import hashlib
+        from sql_utils import create_table_from_sql, extract_sql, extract_table_name, add_columns_to_table
+        from database import normalize_column_name
         import os
         
         # Read CSV file
@@ -313,28 +556,70 @@ def process_upload(file, table_name=None):
         if not table_name:
             table_name = os.path.splitext(os.path.basename(file.name))[0]
             logger.info(f"从文件名生成初始表名：{table_name}")
+        # 列结构演进只针对用户选择的表（未选择时为与文件名同名的表）
+        evolution_target = table_name
         import io
         if hasattr(file, 'read'):  # Handle file-like object
             content = file.read()
-            if isinstance(content, bytes):
-                content = content.decode('utf-8')
-            df = pd.read_csv(io.StringIO(content))
-            logger.info(f"从文件对象读取CSV成功，共{len(df)}行")
+            if isinstance(content, str):
+                content = content.encode('utf-8')
         elif hasattr(file, 'name'):  # Handle file path
-            df = pd.read_csv(file.name)
-            logger.info(f"从文件路径读取CSV成功，共{len(df)}行")
+            with open(file.name, 'rb') as f:
+                content = f.read()
         else:
             logger.error("不支持的文件类型")
             raise ValueError("Unsupported file type")
+
+        # 内容哈希相同的文件已经导入过，直接跳过
+        content_hash = hashlib.sha256(content).hexdigest()
+        file_name = os.path.basename(file.name)
+        ingested = db_manager.get_ingested_file(content_hash)
+        if ingested:
+            logger.info(f"文件已导入过，跳过：{file_name} -> {ingested['table_name']}")
+            return f"文件内容未变化，已于{ingested['ingested_at']}导入表{ingested['table_name']}，跳过"
+
+        df = pd.read_csv(io.BytesIO(content))
+        logger.info(f"读取CSV成功，共{len(df)}行")
         
         # Get column names and types
         columns = df.columns.tolist()
         dtypes = df.dtypes.astype(str).tolist()
         logger.info(f"获取列信息成功，\n 列名：{columns}，类型：{dtypes}")
+        key_columns = [col.strip() for col in (key_columns or "").split(",") if col.strip()]
         
         # Create table name from filename
         table_name = os.path.splitext(os.path.basename(file.name))[0]
         logger.info(f"从文件名生成初始表名：{table_name}")
+
+        # 之前导入过相同列结构的文件时复用该表，不再调用模型判断
+        columns_hash = hashlib.sha256(
+            ",".join(normalize_column_name(col) for col in columns).encode('utf-8')
+        ).hexdigest()
+        existing_table = db_manager.find_table_for_columns(columns_hash)
+        if existing_table:
+            logger.info(f"列结构与已导入的表一致，复用表：{existing_table}")
+            return insert_uploaded_rows(
+                existing_table, df, session, mode, key_columns,
+                content_hash, file_name, columns_hash
+            )
+
+        # 列结构小幅变化时在线扩展目标表
+        if evolve_schema:
+            evolved_table, missing_columns = db_manager.find_evolvable_table(
+                columns, [evolution_target], SCHEMA_EVOLUTION_MIN_OVERLAP, SCHEMA_EVOLUTION_MIN_SHARED_COLUMNS
+            )
+            if evolved_table:
+                if missing_columns:
+                    new_columns = [re.sub(r"\s+", "_", str(col).strip()) for col in missing_columns]
+                    new_dtypes = [str(df[col].dtype) for col in missing_columns]
+                    logger.info(f"为表{evolved_table}添加列：{new_columns}")
+                    add_columns_to_table(evolved_table, new_columns, new_dtypes, db_manager=db_manager)
+                    db_manager.mark_write(session)
+                logger.info(f"使用演进后的表：{evolved_table}")
+                return insert_uploaded_rows(
+                    evolved_table, df, session, mode, key_columns,
+                    content_hash, file_name, columns_hash
+                )
         
         # Get database schema
         logger.info("获取数据库schema")
@@ -368,6 +653,7 @@ def process_upload(file, table_name=None):
             # Create table and get result
             logger.info(f"开始创建表：{table_name}")
             created_table = create_table_from_sql(sql)
+            db_manager.mark_write(session)
             if not created_table:
                 logger.error("创建表失败")
                 return "创建表失败"
@@ -383,22 +669,34 @@ def process_upload(file, table_name=None):
                 return "无法确定表名"
                 
         logger.info(f"最终使用表：{table_name}")
-        
-        # Insert data using insert_from_df which explicitly handles DataFrames
-        logger.info(f"开始插入数据到表{table_name}")
-        result = db_manager.insert_from_df(table_name, df)
-        
-        if result and result.get("status") == "success":
-            logger.info(f"数据插入成功，共插入{len(df)}行")
-            return f"文件上传成功，数据已插入表{table_name}"
-        else:
-            logger.error("文件上传失败")
-            return "文件上传失败"
+        return insert_uploaded_rows(
+            table_name, df, session, mode, key_columns,
+            content_hash, file_name, columns_hash
+        )
     except TypeError as e:
         return f"上传出错: 类型错误 - {str(e)}"
     except Exception as e:
         return f"上传出错: {type(e).__name__} - {str(e)}"
 
+def process_batch(file, concurrency=BATCH_CONCURRENCY, db_type="MySQL", use_cache=True):
+    """批量问答：上传JSONL问题文件，并发执行后返回结果JSONL文件和汇总
+
+    use_cache为False时不使用判断结果和SQL缓存，每个问题都调用模型（用于准确率和耗时回归）。
+    """
+    if not file:
+        return None, {"error": "请上传JSONL问题文件"}
+    path = file if isinstance(file, str) else file.name
+    try:
+        questions = load_questions(path)
+    except (OSError, ValueError) as e:
+        return None, {"error": f"读取问题文件失败: {str(e)}"}
+    if not questions:
+        return None, {"error": "问题文件为空"}
+    fd, output_path = tempfile.mkstemp(prefix="chatdb_batch_", suffix=".jsonl")
+    os.close(fd)
+    summary = run_batch(questions, output_path, concurrency=concurrency, db_type=db_type, use_cache=use_cache)
+    return output_path, summary
+
 # Create Gradio interface
 with gr.Blocks() as app:
     gr.Markdown("# 自然语言查询助手")
@@ -417,6 +715,18 @@ with gr.Blocks() as app:
                     interactive=True,
                     allow_custom_value=True
                 )
+                ingest_mode = gr.Radio(
+                    choices=[("追加", "append"), ("去重更新", "upsert"), ("增量追加", "incremental")],
+                    label="写入模式",
+                    value=INGEST_MODE
+                )
+                key_columns_input = gr.Textbox(
+                    label="去重键/水位列（可选，逗号分隔；去重更新留空时使用主键/唯一索引，都没有时追加）"
+                )
+                evolve_schema_checkbox = gr.Checkbox(
+                    label="列变化时扩展所选表（未选择时为同名表）",
+                    value=SCHEMA_EVOLUTION
+                )
                 upload_btn = gr.Button("上传")
             with gr.Column():
                 upload_output = gr.Textbox(
@@ -425,7 +735,7 @@ with gr.Blocks() as app:
                 )
         upload_btn.click(
             fn=process_upload,
-            inputs=[file_input, table_name_dropdown],
+            inputs=[file_input, table_name_dropdown, ingest_mode, key_columns_input, evolve_schema_checkbox],
             outputs=upload_output
         )
     
@@ -459,17 +769,65 @@ with gr.Blocks() as app:
             )
             
     submit_btn.click(
+        fn=cancel_active_query,
+        queue=False
+    ).then(
         fn=process_query,
         inputs=[question, db_type],
         outputs=[need_db_output, sql_output, output_text],
         api_name="process_query",
         queue=True
     )
+    app.unload(cancel_disconnected_query)
+
+    with gr.Tab("批量问答"):
+        with gr.Row():
+            with gr.Column():
+                batch_file = gr.File(
+                    label="上传JSONL问题文件（每行包含question）",
+                    file_types=[".jsonl"]
+                )
+                batch_concurrency = gr.Slider(
+                    minimum=1,
+                    maximum=BATCH_MAX_CONCURRENCY,
+                    step=1,
+                    value=min(BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY),
+                    label="并发数"
+                )
+                batch_use_cache = gr.Checkbox(
+                    label="批次内共享缓存（关闭后每个问题都调用模型）",
+                    value=True
+                )
+                batch_btn = gr.Button("开始批量问答")
+            with gr.Column():
+                batch_result = gr.File(label="结果（JSONL）")
+                batch_summary = gr.JSON(label="汇总")
+        # 同一worker上同时只运行一个批次，批次内部按并发数并行
+        batch_btn.click(
+            fn=process_batch,
+            inputs=[batch_file, batch_concurrency, db_type, batch_use_cache],
+            outputs=[batch_result, batch_summary],
+            api_name="batch_query",
+            concurrency_limit=1
+        )
+
+    with gr.Tab("运行指标"):
+        metrics_output = gr.JSON(label="所有worker汇总指标")
+        refresh_metrics_btn = gr.Button("刷新")
+        refresh_metrics_btn.click(fn=get_metrics, outputs=metrics_output)
 
 if __name__ == "__main__":
     logger.info("Starting NLP2SQL application")
+    # 多worker部署时只在一个worker上运行索引分析，工作负载由所有worker共同记录
+    if CHATDB_WORKER_ID == 0:
+        index_advisor.start()
     try:
-        app.launch(server_name="0.0.0.0", server_port=8860, share=True)
+        if CHATDB_WORKERS > 1:
+            # 多worker由serve.py启动，通过前置代理对外提供单一端口
+            logger.info(f"Starting worker {CHATDB_WORKER_ID} of {CHATDB_WORKERS}")
+            app.launch(server_name="0.0.0.0", server_port=WORKER_BASE_PORT + CHATDB_WORKER_ID)
+        else:
+            app.launch(server_name="0.0.0.0", server_port=SERVER_PORT, share=True)
     except Exception as e:
         logger.info(f"Application error: {str(e)}", exc_info=True)
     finally:
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from config import BATCH_CONCURRENCY
+from config import BATCH_MAX_CONCURRENCY
+from logger import get_logger
+
+logger = get_logger()
+
+# run_pipeline出错时第一项输出对应的状态
+ERROR_STATES = {
+    "需要数据库Schema": "no_schema",
+    "处理超时": "timeout",
+    "处理出错": "error"
+}
+
+def load_questions(path):
+    """读取JSONL问题文件
+
+    每行为一个JSON对象，必须包含question，可选id和db_type，其余字段原样写入结果
+    （例如期望的SQL或答案，便于回归比较）；也可以直接是问题字符串。
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第{line_no}行不是合法的JSON: {e}")
+            if isinstance(item, str):
+                item = {"question": item}
+            if not isinstance(item, dict) or not str(item.get("question") or "").strip():
+                raise ValueError(f"第{line_no}行缺少question")
+            item.setdefault("id", line_no)
+            questions.append(item)
+    return questions
+
+def answer_question(item, db_type="MySQL", session=None, cache_namespace=""):
+    """执行单个问题，返回包含答案、状态和各阶段耗时的结果
+
+    每个问题应使用独立的session，同一会话的新请求会取消正在执行的请求。
+    cache_namespace含义同run_pipeline。
+    """
+    # 延迟导入，app在模块级别引用本模块
+    from app import run_pipeline
+
+    result = dict(item)
+    stats = {}
+    last = None
+    started = time.monotonic()
+    try:
+        for last in run_pipeline(
+            item["question"], item.get("db_type") or db_type,
+            session=session, stats=stats, cache_namespace=cache_namespace
+        ):
+            pass
+    except Exception as e:
+        logger.error(f"Batch question {item['id']} failed: {e}", exc_info=True)
+        last = ("处理出错", "", [(None, f"Error: {str(e)}")])
+
+    # 重试耗尽后模型仍会根据错误信息作答，记为sql_error
+    error = stats.get("query_error")
+    if last is None:
+        status, need_db, sql, answer = "cancelled", None, None, None
+    else:
+        need_db_text, sql, answer = last
+        if isinstance(answer, list):
+            answer = answer[-1][1] if answer else ""
+        need_db = need_db_text == "需要查询数据库"
+        status = ERROR_STATES.get(need_db_text)
+        if status:
+            error, need_db, sql, answer = answer, None, None, None
+        else:
+            status = "sql_error" if error else "ok"
+            if not need_db:
+                sql = None
+
+    result.update({
+        "status": status,
+        "need_db": need_db,
+        "sql": sql or None,
+        "answer": answer,
+        "error": error,
+        "sql_attempts": stats.get("sql_attempts", 0),
+        "cache_hits": stats.get("cache_hits", []),
+        "timings": stats.get("timings", {}),
+        "total": round(time.monotonic() - started, 3)
+    })
+    return result
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+def run_batch(questions, output_path, concurrency=BATCH_CONCURRENCY, db_type="MySQL", use_cache=True):
+    """并发执行一批问题，结果按完成顺序逐行写入output_path（JSONL），返回汇总
+
+    所有问题共用进程内的模型客户端、数据库管理器和schema缓存。判断结果和SQL缓存按批次隔离：
+    同一批次内重复的问题只有第一次需要调用模型，不会命中其他批次或界面请求留下的缓存，
+    use_cache为False时完全不使用这两项缓存。
+    """
+    # 延迟导入，app在模块级别引用本模块
+    from app import get_schema
+
+    concurrency = max(1, min(int(concurrency or BATCH_CONCURRENCY), BATCH_MAX_CONCURRENCY))
+    batch_id = uuid.uuid4().hex[:8]
+    cache_namespace = f"batch-{batch_id}" if use_cache else None
+    logger.info(f"Starting batch {batch_id}: {len(questions)} questions, concurrency {concurrency}")
+    started = time.monotonic()
+    # 先加载一次schema，避免各线程同时在缓存未命中时重复加载
+    get_schema(db_type)
+
+    statuses = {}
+    latencies = []
+    stage_totals = {}
+    with open(output_path, "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"batch-{batch_id}") as executor:
+        futures = [
+            executor.submit(answer_question, item, db_type, f"batch-{batch_id}-{index}", cache_namespace)
+            for index, item in enumerate(questions)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            out.flush()
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+            latencies.append(result["total"])
+            for stage, seconds in result["timings"].items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+            if done % 100 == 0:
+                logger.info(f"Batch {batch_id}: {done}/{len(questions)} questions done")
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "batch_id": batch_id,
+        "questions": len(questions),
+        "concurrency": concurrency,
+        "use_cache": use_cache,
+        "elapsed": round(elapsed, 3),
+        "questions_per_second": round(len(questions) / elapsed, 3) if elapsed else None,
+        "statuses": statuses,
+        "latency": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "max": max(latencies) if latencies else None
+        },
+        "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stage_totals.items()},
+        "output": output_path
+    }
+    logger.info(f"Finished batch {batch_id}: {summary}")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量问答：读取JSONL问题文件，结果写入JSONL")
+    parser.add_argument("input", help="问题文件，每行一个JSON对象，包含question")
+    parser.add_argument("-o", "--output", help="结果文件，默认为<input>.results.jsonl")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY, help="并发执行的问题数")
+    parser.add_argument("--db-type", default="MySQL", help="数据库类型")
+    parser.add_argument("--no-cache", action="store_true", help="不使用判断结果和SQL缓存，每个问题都调用模型")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    try:
+        questions = load_questions(args.input)
+    except (OSError, ValueError) as e:
+        print(f"读取问题文件失败: {e}", file=sys.stderr)
+        return 2
+    summary = run_batch(
+        questions, output, concurrency=args.concurrency, db_type=args.db_type, use_cache=not args.no_cache
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    # 供定时任务判断：存在未成功回答的问题时返回非0
+    return 0 if summary["statuses"].get("ok", 0) == summary["questions"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import threading
+import time
+from logger import get_logger
+
+logger = get_logger()
+
+class QueryCancelled(Exception):
+    """请求被取消（客户端断开或发起了新的问题）"""
+
+class QueryTimeout(QueryCancelled):
+    """请求或单个阶段超出时间预算"""
+
+class CancelScope:
+    """单个请求的取消范围和时间预算
+
+    取消时依次调用已注册的回调（例如对正在执行的MySQL查询执行KILL QUERY），
+    各阶段通过check()在超时或取消后尽快退出。
+    """
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_handle = 0
+        self._timer = None
+        if timeout:
+            # 到期后主动取消，阻塞中的数据库查询也能被终止
+            self._timer = threading.Timer(timeout, self.cancel, args=("timeout",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """剩余时间（秒），没有时间预算时返回None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self, deadline=None):
+        """已取消或超出预算时抛出异常"""
+        if self._cancelled.is_set():
+            if self.reason == "timeout":
+                raise QueryTimeout("Request time budget exceeded")
+            raise QueryCancelled(f"Request cancelled: {self.reason}")
+        now = time.monotonic()
+        if self.deadline is not None and now >= self.deadline:
+            raise QueryTimeout("Request time budget exceeded")
+        if deadline is not None and now >= deadline:
+            raise QueryTimeout("Stage time budget exceeded")
+
+    def add_callback(self, callback):
+        """注册取消回调，返回用于注销的句柄"""
+        with self._lock:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._callbacks[handle] = callback
+        return handle
+
+    def remove_callback(self, handle):
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+            callbacks = list(self._callbacks.values())
+        logger.info(f"Cancelling request: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error running cancel callback: {e}")
+
+    def close(self):
+        """请求结束，停止超时计时器"""
+        if self._timer:
+            self._timer.cancel()
+
+# session -> 当前正在执行的请求
+_active_scopes = {}
+_active_lock = threading.Lock()
+
+def start_request(session, timeout=None):
+    """为会话创建新的取消范围，并取消该会话之前仍在执行的请求"""
+    scope = CancelScope(timeout)
+    with _active_lock:
+        previous = _active_scopes.get(session)
+        _active_scopes[session] = scope
+    if previous:
+        previous.cancel("superseded by a new request")
+    return scope
+
+def finish_request(session, scope):
+    """请求结束后注销取消范围"""
+    scope.close()
+    with _active_lock:
+        if _active_scopes.get(session) is scope:
+            del _active_scopes[session]
+
+def cancel_session(session, reason="cancelled"):
+    """取消会话正在执行的请求"""
+    with _active_lock:
+        scope = _active_scopes.pop(session, None)
+    if scope:
+        scope.cancel(reason)
+        scope.close()
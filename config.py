@@ -13,7 +13,100 @@ MYSQL_CONFIG = {
     'database': os.getenv('MYSQL_DATABASE', 'movies')
 }
 
+def _parse_replicas(value):
+    """解析只读副本列表，格式：host1[:port],host2[:port]，账号与库名沿用主库配置"""
+    replicas = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        replicas.append({
+            **MYSQL_CONFIG,
+            'host': host,
+            'port': int(port) if port else MYSQL_CONFIG['port'],
+            'connect_timeout': int(os.getenv('MYSQL_REPLICA_CONNECT_TIMEOUT', 5))
+        })
+    return replicas
+
+# MySQL Read Replica Configuration
+MYSQL_REPLICA_CONFIGS = _parse_replicas(os.getenv('MYSQL_REPLICAS', ''))
+# round_robin or least_loaded
+MYSQL_READ_BALANCE = os.getenv('MYSQL_READ_BALANCE', 'round_robin')
+# Max replication lag in seconds, 0 disables the lag check
+MYSQL_REPLICA_MAX_LAG = int(os.getenv('MYSQL_REPLICA_MAX_LAG', 0))
+MYSQL_REPLICA_CHECK_INTERVAL = int(os.getenv('MYSQL_REPLICA_CHECK_INTERVAL', 10))
+# Reads within this many seconds after a session's own write go to the primary
+MYSQL_READ_YOUR_WRITES_WINDOW = int(os.getenv('MYSQL_READ_YOUR_WRITES_WINDOW', 30))
+
 # Ollama Configuration
 OLLAMA_API_URL = os.getenv('OLLAMA_API_URL', 'http://ollama_ip:11434')
 OLLAMA_CHAT_MODEL = os.getenv('OLLAMA_CHAT_MODEL', 'qwen2.5:32b')
 OLLAMA_CODE_MODEL = os.getenv('OLLAMA_CODE_MODEL', 'qwen2.5-coder:32b')
+
+# Request Time Budgets
+# Total seconds for one question, 0 disables the budget
+REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', 300))
+# Seconds for each LLM stage (need-db check, SQL generation, answer)
+LLM_STAGE_TIMEOUT = int(os.getenv('LLM_STAGE_TIMEOUT', 120))
+# Server side MAX_EXECUTION_TIME for generated SELECTs in milliseconds
+MYSQL_MAX_EXECUTION_TIME = int(os.getenv('MYSQL_MAX_EXECUTION_TIME', 30000))
+
+# Ingestion Configuration
+# Default upload mode: append, upsert or incremental
+INGEST_MODE = os.getenv('INGEST_MODE', 'upsert')
+# Extend the closest existing table with new columns instead of creating a new one
+SCHEMA_EVOLUTION = os.getenv('SCHEMA_EVOLUTION', 'true').lower() == 'true'
+# Minimum column overlap (intersection / union) to treat an upload as the same table
+SCHEMA_EVOLUTION_MIN_OVERLAP = float(os.getenv('SCHEMA_EVOLUTION_MIN_OVERLAP', 0.6))
+# Minimum number of shared columns, generic headers like id,name,date alone never match
+SCHEMA_EVOLUTION_MIN_SHARED_COLUMNS = int(os.getenv('SCHEMA_EVOLUTION_MIN_SHARED_COLUMNS', 3))
+
+# Index Advisor Configuration
+# off, report (log candidates ranked by EXPLAIN cost, no DDL), evaluate (measure candidates with a
+# temporary invisible index and EXPLAIN, then drop it) or apply (evaluate and keep beneficial indexes)
+INDEX_ADVISOR_MODE = os.getenv('INDEX_ADVISOR_MODE', 'report')
+INDEX_ADVISOR_INTERVAL = int(os.getenv('INDEX_ADVISOR_INTERVAL', 600))
+INDEX_ADVISOR_MAX_INDEXES_PER_TABLE = int(os.getenv('INDEX_ADVISOR_MAX_INDEXES_PER_TABLE', 5))
+# Minimum executions of queries that would use a candidate before it is evaluated
+INDEX_ADVISOR_MIN_QUERIES = int(os.getenv('INDEX_ADVISOR_MIN_QUERIES', 3))
+# Minimum estimated EXPLAIN cost reduction (0-1) to recommend an index
+INDEX_ADVISOR_MIN_BENEFIT = float(os.getenv('INDEX_ADVISOR_MIN_BENEFIT', 0.2))
+# Candidates evaluated per analysis round (each evaluation builds an invisible index)
+INDEX_ADVISOR_MAX_EVALUATIONS = int(os.getenv('INDEX_ADVISOR_MAX_EVALUATIONS', 5))
+# Candidates recommended per analysis round, ranked by estimated benefit
+INDEX_ADVISOR_TOP_N = int(os.getenv('INDEX_ADVISOR_TOP_N', 3))
+# Seconds an index DDL waits for the metadata lock before the round is skipped
+INDEX_ADVISOR_LOCK_WAIT_TIMEOUT = int(os.getenv('INDEX_ADVISOR_LOCK_WAIT_TIMEOUT', 5))
+
+# Summary Table Configuration
+# Executions of the same aggregate query before a summary table is built, 0 disables summary tables
+SUMMARY_TABLE_MIN_HITS = int(os.getenv('SUMMARY_TABLE_MIN_HITS', 5))
+SUMMARY_TABLE_MAX = int(os.getenv('SUMMARY_TABLE_MAX', 20))
+# Seconds between reloads of the shared summary table registry
+SUMMARY_TABLE_REGISTRY_TTL = int(os.getenv('SUMMARY_TABLE_REGISTRY_TTL', 30))
+
+# Multi-worker Deployment
+# Number of worker processes started by serve.py
+CHATDB_WORKERS = int(os.getenv('CHATDB_WORKERS', 1))
+# Set by serve.py for each worker process
+CHATDB_WORKER_ID = int(os.getenv('CHATDB_WORKER_ID', 0))
+SERVER_PORT = int(os.getenv('SERVER_PORT', 8860))
+LOG_DIR = os.getenv('LOG_DIR', '/app/logs')
+# Worker i listens on WORKER_BASE_PORT + i when CHATDB_WORKERS > 1
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', 8861))
+
+# Shared Cache Configuration (SQLite in WAL mode, shared by all workers)
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', '/app/data/chatdb_shared.db')
+# Cache TTLs in seconds, 0 disables the cache
+SCHEMA_CACHE_TTL = int(os.getenv('SCHEMA_CACHE_TTL', 300))
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 3600))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 300))
+# Results larger than this many characters are not cached
+RESULT_CACHE_MAX_SIZE = int(os.getenv('RESULT_CACHE_MAX_SIZE', 1024 * 1024))
+
+# Batch Question API (python batch.py / batch_query endpoint)
+# Questions evaluated in parallel, keep at or below OLLAMA_NUM_PARALLEL on the Ollama server
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+# Upper bound for the concurrency requested by a single batch
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 16))
@@ -1,22 +1,262 @@
+import hashlib
+import re
+import threading
+import time
 import pymysql
 from config import MYSQL_CONFIG
+from config import MYSQL_REPLICA_CONFIGS
+from config import MYSQL_READ_BALANCE
+from config import MYSQL_REPLICA_MAX_LAG
+from config import MYSQL_REPLICA_CHECK_INTERVAL
+from config import MYSQL_READ_YOUR_WRITES_WINDOW
+from config import SCHEMA_CACHE_TTL
+from config import RESULT_CACHE_TTL
+from config import RESULT_CACHE_MAX_SIZE
 import pandas as pd
+from cancellation import QueryCancelled
+from cancellation import QueryTimeout
 from logger import get_logger
+from shared_store import get_shared_store
 
 logger = get_logger()
 
+# 语句开头的关键字（忽略开头的注释和括号）
+STATEMENT_KEYWORD_PATTERN = re.compile(
+    r"^\s*(?:(?:--[^\n]*\n|/\*.*?\*/)\s*)*\(*\s*([A-Za-z]+)\b",
+    re.DOTALL
+)
+# 只读语句，WITH开头时按公共表表达式之后的主语句判断
+READ_STATEMENTS = {"select", "show", "explain", "desc", "describe", "table"}
+# 修改数据或表结构的语句，执行后需要使缓存失效并通知write observers
+WRITE_STATEMENTS = {
+    "insert", "update", "delete", "replace", "create", "alter", "drop", "truncate",
+    "rename", "load", "grant", "revoke", "call"
+}
+# 需要锁或写文件的SELECT仍然走主库
+LOCKING_READ_PATTERN = re.compile(
+    r"\bfor\s+(?:update|share)\b|\block\s+in\s+share\s+mode\b|\binto\s+(?:outfile|dumpfile|@)",
+    re.IGNORECASE
+)
+
+# 内部表前缀，这些表不会出现在给模型的schema和表名列表中
+INTERNAL_TABLE_PREFIX = "_chatdb_"
+INGEST_MANIFEST_TABLE = f"{INTERNAL_TABLE_PREFIX}ingest_manifest"
+INGEST_WATERMARK_TABLE = f"{INTERNAL_TABLE_PREFIX}ingest_watermark"
+
+def normalize_column_name(name):
+    """规范化列名：忽略大小写、空格、下划线和驼峰差异"""
+    return re.sub(r"[\s_\-]", "", str(name)).lower()
+
+def statement_keyword(query):
+    """返回语句的主关键字（小写）及其位置，WITH开头时跳过公共表表达式，无法识别时返回(None, -1)"""
+    match = STATEMENT_KEYWORD_PATTERN.match(query)
+    if not match:
+        return None, -1
+    keyword = match.group(1).lower()
+    if keyword != "with":
+        return keyword, match.start(1)
+    # 公共表表达式之后第一个位于顶层（括号和引号之外）的语句关键字
+    depth, quote, i = 0, None, match.end(1)
+    while i < len(query):
+        ch = query[i]
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and (ch.isalnum() or ch in "_$"):
+            word = re.match(r"[\w$]+", query[i:]).group(0)
+            if word.lower() in READ_STATEMENTS | WRITE_STATEMENTS:
+                return word.lower(), i
+            i += len(word)
+            continue
+        i += 1
+    return None, -1
+
+# 查询被KILL QUERY中断 / 超出MAX_EXECUTION_TIME
+ER_QUERY_INTERRUPTED = 1317
+ER_NO_SUCH_TABLE = 1146
+ER_QUERY_TIMEOUT = 3024
+
+def apply_max_execution_time(query, timeout_ms):
+    """为SELECT语句（包括WITH ... SELECT）添加服务端执行时间上限（毫秒）"""
+    if not timeout_ms or "MAX_EXECUTION_TIME" in query.upper():
+        return query
+    keyword, position = statement_keyword(query)
+    if keyword != "select":
+        return query
+    position += len("select")
+    return f"{query[:position]} /*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */{query[position:]}"
+
 class DatabaseManager:
-    def __init__(self):
-        self.mysql_conn = None
+    def __init__(self, primary_config=None, replica_configs=None):
+        self.mysql_config = primary_config or MYSQL_CONFIG
+        # pymysql连接不是线程安全的，每个线程使用独立的主库/副本连接
+        self._local = threading.local()
+        if replica_configs is None:
+            replica_configs = MYSQL_REPLICA_CONFIGS
+        self.replicas = [
+            {
+                "config": replica_config,
+                "local": threading.local(),
+                "healthy": True,
+                "checked_at": 0.0,
+                "lag": None,
+                "in_flight": 0
+            }
+            for replica_config in replica_configs
+        ]
+        self._replica_lock = threading.Lock()
+        self._next_replica = 0
+        # session -> 最近一次写入时间，用于read-your-writes
+        self._recent_writes = {}
+        self._ingest_tables_ready = False
+        # 只读查询执行成功后的回调：observer(query, elapsed_seconds, session)
+        self.query_observers = []
+        # 只读查询执行前的改写：rewriter(query) -> query
+        self.query_rewriters = []
+        # 写入回调：observer(event)，event包含table_name/mode/columns/rows/cursor/statement
+        self.write_observers = []
         
+    @property
+    def mysql_conn(self):
+        """当前线程的主库连接"""
+        return getattr(self._local, "conn", None)
+
+    @mysql_conn.setter
+    def mysql_conn(self, conn):
+        self._local.conn = conn
+
     def connect_mysql(self):
         try:
-            self.mysql_conn = pymysql.connect(**MYSQL_CONFIG)
+            # 自动提交：读取不会长期持有快照和元数据锁，需要事务的写入显式begin()
+            self.mysql_conn = pymysql.connect(**{**self.mysql_config, "autocommit": True})
             logger.info("Successfully connected to MySQL database")
             return True
         except Exception as e:
             logger.error(f"MySQL connection error: {e}")
             return False
+
+    @staticmethod
+    def is_read_query(query):
+        """判断是否为可以路由到只读副本的查询"""
+        return statement_keyword(query)[0] in READ_STATEMENTS and not LOCKING_READ_PATTERN.search(query)
+
+    @staticmethod
+    def is_write_query(query):
+        """判断是否为修改数据或表结构的语句"""
+        return statement_keyword(query)[0] in WRITE_STATEMENTS
+
+    def write_generation(self):
+        """数据库写入代数，所有worker共享，每次写入后递增，用于使缓存失效"""
+        return int(get_shared_store().counter("write_generation", self.mysql_config['database']))
+
+    def mark_write(self, session=None):
+        """记录会话的写入时间，之后一段时间内该会话的读请求走主库，并使共享缓存失效"""
+        now = time.time()
+        get_shared_store().incr("write_generation", self.mysql_config['database'])
+        get_shared_store().set("write_time", self.mysql_config['database'], now)
+        with self._replica_lock:
+            self._recent_writes = {
+                key: ts for key, ts in self._recent_writes.items()
+                if now - ts < MYSQL_READ_YOUR_WRITES_WINDOW
+            }
+            self._recent_writes[session] = now
+
+    def _reads_pinned_to_primary(self, session=None):
+        written_at = self._recent_writes.get(session)
+        return written_at is not None and time.time() - written_at < MYSQL_READ_YOUR_WRITES_WINDOW
+
+    def _replicas_may_lag(self):
+        """最近一次写入（任一worker）是否仍在read-your-writes窗口内，此时副本可能还没有追上主库"""
+        if not self.replicas:
+            return False
+        written_at = get_shared_store().get("write_time", self.mysql_config['database'])
+        return written_at is not None and time.time() - written_at < MYSQL_READ_YOUR_WRITES_WINDOW
+
+    @staticmethod
+    def _replica_conn(replica):
+        """当前线程的副本连接"""
+        return getattr(replica["local"], "conn", None)
+
+    def _connect_replica(self, replica):
+        address = f"{replica['config']['host']}:{replica['config']['port']}"
+        try:
+            # 自动提交：每次读取都看到最新的复制数据，也不会长期持有元数据锁阻塞复制应用DDL
+            replica["local"].conn = pymysql.connect(**{**replica["config"], "autocommit": True})
+            logger.info(f"Successfully connected to MySQL replica {address}")
+            return True
+        except Exception as e:
+            logger.error(f"MySQL replica connection error ({address}): {e}")
+            replica["local"].conn = None
+            return False
+
+    def _get_replication_lag(self, conn):
+        """获取副本复制延迟（秒），复制未运行时返回None"""
+        with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except pymysql.err.ProgrammingError:
+                # MySQL 8.0.22之前的版本
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+        if not status:
+            return None
+        if "Seconds_Behind_Source" in status:
+            return status["Seconds_Behind_Source"]
+        return status.get("Seconds_Behind_Master")
+
+    def _check_replica(self, replica):
+        """健康检查：连接可用且复制延迟在限制之内，结果按间隔缓存"""
+        now = time.time()
+        if now - replica["checked_at"] < MYSQL_REPLICA_CHECK_INTERVAL:
+            return replica["healthy"]
+        replica["checked_at"] = now
+        address = f"{replica['config']['host']}:{replica['config']['port']}"
+        try:
+            conn = self._replica_conn(replica)
+            if not conn or not conn.open:
+                if not self._connect_replica(replica):
+                    replica["healthy"] = False
+                    return False
+                conn = self._replica_conn(replica)
+            conn.ping(reconnect=True)
+            if MYSQL_REPLICA_MAX_LAG > 0:
+                replica["lag"] = self._get_replication_lag(conn)
+                if replica["lag"] is None or replica["lag"] > MYSQL_REPLICA_MAX_LAG:
+                    logger.warning(f"MySQL replica {address} lag too high or replication stopped: {replica['lag']}")
+                    replica["healthy"] = False
+                    return False
+            replica["healthy"] = True
+        except Exception as e:
+            logger.error(f"MySQL replica health check failed ({address}): {e}")
+            replica["healthy"] = False
+        return replica["healthy"]
+
+    def _acquire_replica(self, session=None):
+        """选择一个健康的只读副本，没有可用副本时返回None（使用主库）"""
+        if not self.replicas or self._reads_pinned_to_primary(session):
+            return None
+        healthy = [replica for replica in self.replicas if self._check_replica(replica)]
+        if not healthy:
+            logger.warning("No healthy MySQL replica available, reading from primary")
+            return None
+        with self._replica_lock:
+            if MYSQL_READ_BALANCE == "least_loaded":
+                replica = min(healthy, key=lambda r: r["in_flight"])
+            else:
+                replica = healthy[self._next_replica % len(healthy)]
+                self._next_replica += 1
+            replica["in_flight"] += 1
+        return replica
+
+    def _release_replica(self, replica):
+        with self._replica_lock:
+            replica["in_flight"] -= 1
             
     def get_table_names(self):
         """获取数据库中所有表名"""
@@ -27,13 +267,24 @@ class DatabaseManager:
             with self.mysql_conn.cursor() as cursor:
                 cursor.execute("SHOW TABLES")
                 tables = cursor.fetchall()
-                return [table[0] for table in tables]
+                return [table[0] for table in tables if not table[0].startswith(INTERNAL_TABLE_PREFIX)]
         except Exception as e:
             logger.error(f"Error getting table names: {e}")
             return []
 
     def get_mysql_schema(self):
-        """Get MySQL database schema information"""
+        """Get MySQL database schema information (cached in the shared store until the next write)"""
+        cache_key = f"{self.mysql_config['database']}:{self.write_generation()}"
+        if SCHEMA_CACHE_TTL:
+            cached = get_shared_store().get("schema", cache_key)
+            if cached:
+                return cached
+        schema = self._load_mysql_schema()
+        if schema and SCHEMA_CACHE_TTL:
+            get_shared_store().set("schema", cache_key, schema, ttl=SCHEMA_CACHE_TTL)
+        return schema
+
+    def _load_mysql_schema(self):
         try:
             if not self.mysql_conn or not self.mysql_conn.open:
                 self.connect_mysql()
@@ -44,8 +295,8 @@ class DatabaseManager:
                 cursor.execute("""
                     SELECT TABLE_NAME 
                     FROM INFORMATION_SCHEMA.TABLES 
-                    WHERE TABLE_SCHEMA = %s
-                """, (MYSQL_CONFIG['database'],))
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME NOT LIKE %s
+                """, (self.mysql_config['database'], INTERNAL_TABLE_PREFIX.replace("_", "\\_") + "%"))
                 
                 tables = cursor.fetchall()
                 logger.info(f"Found {len(tables)} tables in MySQL database")
@@ -57,7 +308,7 @@ class DatabaseManager:
                         SELECT COLUMN_NAME, DATA_TYPE, COLUMN_KEY, IS_NULLABLE
                         FROM INFORMATION_SCHEMA.COLUMNS
                         WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
-                    """, (MYSQL_CONFIG['database'], table_name))
+                    """, (self.mysql_config['database'], table_name))
                     
                     columns = cursor.fetchall()
                     table_schema = [
@@ -92,14 +343,27 @@ class DatabaseManager:
             result_lines.append(" | ".join(str(val) for val in row))
         return "\n".join(result_lines)
 
-    def execute_mysql_query(self, query):
-        """执行SQL查询并返回格式化文本结果"""
+    def kill_query(self, mysql_config, thread_id):
+        """通过旁路连接终止指定连接上正在执行的查询"""
         try:
-            if not self.mysql_conn or not self.mysql_conn.open:
-                self.connect_mysql()
-                
-            with self.mysql_conn.cursor() as cursor:
-                logger.info(f"Executing MySQL query: {query}")
+            conn = pymysql.connect(**mysql_config)
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("KILL QUERY %s", (thread_id,))
+            finally:
+                conn.close()
+            logger.info(f"Killed query on connection {thread_id} ({mysql_config['host']})")
+        except Exception as e:
+            logger.error(f"Error killing query on connection {thread_id}: {e}")
+
+    def _run_query(self, conn, mysql_config, query, cancel_scope=None):
+        handle = None
+        if cancel_scope:
+            cancel_scope.check()
+            thread_id = conn.thread_id()
+            handle = cancel_scope.add_callback(lambda: self.kill_query(mysql_config, thread_id))
+        try:
+            with conn.cursor() as cursor:
                 cursor.execute(query)
                 
                 # 获取查询结果
@@ -110,50 +374,551 @@ class DatabaseManager:
                 else:
                     # 对于非查询语句，返回受影响行数
                     return f"Query executed successfully. Affected rows: {cursor.rowcount}"
+        except pymysql.err.OperationalError as e:
+            if e.args and e.args[0] == ER_QUERY_TIMEOUT:
+                raise QueryTimeout(f"Query exceeded max execution time: {e}") from e
+            if e.args and e.args[0] == ER_QUERY_INTERRUPTED and cancel_scope and cancel_scope.cancelled:
+                cancel_scope.check()
+            raise
+        finally:
+            if handle is not None:
+                cancel_scope.remove_callback(handle)
+
+    def execute_mysql_query(self, query, session=None, cancel_scope=None, max_execution_time=None):
+        """执行SQL查询并返回格式化文本结果
+
+        只读查询优先路由到只读副本，DDL/写入以及会话写入后的读取走主库。
+        max_execution_time（毫秒）为SELECT添加服务端执行时间上限，
+        cancel_scope被取消时通过旁路连接KILL QUERY终止正在执行的查询。
+        只读查询先经过query_rewriters改写，执行成功后将实际执行的SQL和耗时通知query_observers；
+        命中结果缓存时同样通知，耗时为缓存时记录的执行耗时。
+        """
+        is_read = self.is_read_query(query)
+        original = query
+        if is_read:
+            query = self._rewrite_query(query)
+        statement = query
+        if is_read and max_execution_time:
+            statement = apply_max_execution_time(query, max_execution_time)
+        cache_key = None
+        # 写入后固定读主库的会话不读写结果缓存：缓存中可能是其他会话从延迟副本读到的旧结果
+        if is_read and RESULT_CACHE_TTL and not self._reads_pinned_to_primary(session):
+            # 结果缓存按写入代数区分，任一worker写入后自动失效
+            cache_key = hashlib.sha256(f"{self.write_generation()}:{query}".encode("utf-8")).hexdigest()
+            cached = get_shared_store().get("query_result", cache_key)
+            if cached is not None:
+                logger.info(f"Result cache hit: {query}")
+                get_shared_store().incr("metrics", "result_cache_hits")
+                # 命中缓存的查询仍计入工作负载，否则索引建议和汇总表看不到最频繁的查询
+                self._notify_query_observers(query, cached["elapsed"], session)
+                return cached["result"]
+        # 写入后不久从副本读到的结果可能缺少这次写入，不写入缓存，以免窗口结束后仍读到旧结果
+        if cache_key and self._replicas_may_lag():
+            cache_key = None
+        started = time.monotonic()
+        try:
+            result = self._execute(statement, is_read, session, cancel_scope)
+        except pymysql.err.ProgrammingError as e:
+            # 改写后的查询引用的表（如刚建立的汇总表）在副本上还不存在，执行原始查询
+            if query == original or not e.args or e.args[0] != ER_NO_SUCH_TABLE:
+                raise
+            logger.warning(f"Rewritten query failed ({e}), running original query")
+            query = original
+            statement = apply_max_execution_time(query, max_execution_time) if max_execution_time else query
+            result = self._execute(statement, is_read, session, cancel_scope)
+        if is_read:
+            elapsed = time.monotonic() - started
+            self._notify_query_observers(query, elapsed, session)
+            if cache_key and len(result) <= RESULT_CACHE_MAX_SIZE:
+                get_shared_store().set(
+                    "query_result", cache_key, {"result": result, "elapsed": elapsed}, ttl=RESULT_CACHE_TTL
+                )
+        return result
+
+    def _rewrite_query(self, query):
+        for rewriter in self.query_rewriters:
+            try:
+                query = rewriter(query)
+            except Exception as e:
+                logger.error(f"Error rewriting query: {e}")
+        return query
+
+    def _notify_write_observers(self, event):
+        """通知write observers
+
+        带cursor的事件在写入事务中通知，observer出错时异常向上抛出使写入回滚，
+        避免派生数据（如汇总表）与基表不一致；已提交语句的事件只记录错误。
+        """
+        for observer in self.write_observers:
+            try:
+                observer(event)
+            except Exception as e:
+                logger.error(f"Error notifying write observer: {e}")
+                if event.get("cursor") is not None:
+                    raise
+
+    def _notify_query_observers(self, query, elapsed, session=None):
+        for observer in self.query_observers:
+            try:
+                observer(query, elapsed, session)
+            except Exception as e:
+                logger.error(f"Error notifying query observer: {e}")
+
+    def _execute(self, query, is_read, session=None, cancel_scope=None):
+        replica = self._acquire_replica(session) if is_read else None
+        if replica:
+            address = f"{replica['config']['host']}:{replica['config']['port']}"
+            try:
+                conn = self._replica_conn(replica)
+                # 健康检查结果是共享的，当前线程可能还没有该副本的连接
+                if not conn or not conn.open:
+                    if not self._connect_replica(replica):
+                        raise pymysql.err.InterfaceError(f"Cannot connect to MySQL replica {address}")
+                    conn = self._replica_conn(replica)
+                logger.info(f"Executing MySQL query on replica {address}: {query}")
+                return self._run_query(conn, replica["config"], query, cancel_scope)
+            except QueryCancelled:
+                raise
+            except (pymysql.err.InterfaceError, pymysql.err.OperationalError) as e:
+                # 2000以上为客户端连接错误，标记副本不可用并回退到主库
+                if isinstance(e, pymysql.err.OperationalError) and e.args and e.args[0] < 2000:
+                    logger.error(f"Error executing query: {query}")
+                    raise e
+                logger.error(f"MySQL replica {address} failed, falling back to primary: {e}")
+                replica["healthy"] = False
+            except Exception as e:
+                logger.error(f"Error executing query: {query}")
+                raise e
+            finally:
+                self._release_replica(replica)
+
+        try:
+            if not self.mysql_conn or not self.mysql_conn.open:
+                self.connect_mysql()
+                
+            logger.info(f"Executing MySQL query: {query}")
+            result = self._run_query(self.mysql_conn, self.mysql_config, query, cancel_scope)
+            if self.is_write_query(query):
+                self.mark_write(session)
+                self._notify_write_observers({
+                    "table_name": None,
+                    "mode": "statement",
+                    "statement": query,
+                    "cursor": None
+                })
+            return result
+        except QueryCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error executing query: {query}")
             raise e
 
     def close_connections(self):
+        """关闭当前线程的数据库连接"""
         if self.mysql_conn:
             self.mysql_conn.close()
+            self.mysql_conn = None
             logger.info("Closed MySQL connection")
+        for replica in self.replicas:
+            conn = self._replica_conn(replica)
+            if conn:
+                conn.close()
+                replica["local"].conn = None
+                logger.info(f"Closed MySQL replica connection {replica['config']['host']}:{replica['config']['port']}")
+
+    def _ensure_ingest_tables(self):
+        """创建导入清单表和水位表（内部表，不出现在schema中）"""
+        if self._ingest_tables_ready:
+            return
+        with self.mysql_conn.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS `{INGEST_MANIFEST_TABLE}` (
+                    content_hash CHAR(64) PRIMARY KEY,
+                    file_name VARCHAR(255),
+                    table_name VARCHAR(64),
+                    columns_hash CHAR(64),
+                    row_count INT,
+                    mode VARCHAR(16),
+                    ingested_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    KEY idx_columns_hash (columns_hash)
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS `{INGEST_WATERMARK_TABLE}` (
+                    table_name VARCHAR(64),
+                    source VARCHAR(255),
+                    row_offset BIGINT,
+                    watermark_column VARCHAR(64),
+                    watermark_value VARCHAR(255),
+                    watermark_type VARCHAR(16),
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (table_name, source)
+                )
+            """)
+            # 早期版本创建的水位表没有watermark_type列
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = 'watermark_type'
+            """, (self.mysql_config['database'], INGEST_WATERMARK_TABLE))
+            if not cursor.fetchone()[0]:
+                cursor.execute(f"ALTER TABLE `{INGEST_WATERMARK_TABLE}` ADD COLUMN watermark_type VARCHAR(16)")
+        self.mysql_conn.commit()
+        self._ingest_tables_ready = True
+
+    def get_ingested_file(self, content_hash):
+        """按文件内容哈希查询导入清单，未导入过或导入的表已被删除时返回None"""
+        try:
+            if not self.mysql_conn or not self.mysql_conn.open:
+                self.connect_mysql()
+            self._ensure_ingest_tables()
+            with self.mysql_conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute(f"""
+                    SELECT m.*
+                    FROM `{INGEST_MANIFEST_TABLE}` m
+                    JOIN INFORMATION_SCHEMA.TABLES t
+                      ON t.TABLE_SCHEMA = %s AND t.TABLE_NAME = m.table_name
+                    WHERE m.content_hash = %s
+                """, (self.mysql_config['database'], content_hash))
+                return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error reading ingest manifest: {e}")
+            return None
+
+    def find_table_for_columns(self, columns_hash):
+        """查找之前导入过相同列结构的表，用于跳过建表判断"""
+        try:
+            if not self.mysql_conn or not self.mysql_conn.open:
+                self.connect_mysql()
+            self._ensure_ingest_tables()
+            with self.mysql_conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT m.table_name
+                    FROM `{INGEST_MANIFEST_TABLE}` m
+                    JOIN INFORMATION_SCHEMA.TABLES t
+                      ON t.TABLE_SCHEMA = %s AND t.TABLE_NAME = m.table_name
+                    WHERE m.columns_hash = %s
+                    ORDER BY m.ingested_at DESC
+                    LIMIT 1
+                """, (self.mysql_config['database'], columns_hash))
+                row = cursor.fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error reading ingest manifest: {e}")
+            return None
+
+    def record_ingested_file(self, content_hash, file_name, table_name, columns_hash, row_count, mode):
+        """记录已导入的文件"""
+        try:
+            if not self.mysql_conn or not self.mysql_conn.open:
+                self.connect_mysql()
+            self._ensure_ingest_tables()
+            with self.mysql_conn.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO `{INGEST_MANIFEST_TABLE}`
+                        (content_hash, file_name, table_name, columns_hash, row_count, mode)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE table_name = VALUES(table_name), row_count = VALUES(row_count),
+                        mode = VALUES(mode), ingested_at = CURRENT_TIMESTAMP
+                """, (content_hash, file_name, table_name, columns_hash, row_count, mode))
+            self.mysql_conn.commit()
+        except Exception as e:
+            logger.error(f"Error recording ingested file {file_name}: {e}")
+
+    def get_table_columns(self, table_name):
+        """按定义顺序返回表的列名"""
+        with self.mysql_conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+                ORDER BY ORDINAL_POSITION
+            """, (self.mysql_config['database'], table_name))
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_unique_keys(self, table_name):
+        """返回表的主键/唯一索引列，主键在前"""
+        with self.mysql_conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT INDEX_NAME, COLUMN_NAME
+                FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND NON_UNIQUE = 0
+                ORDER BY INDEX_NAME = 'PRIMARY' DESC, INDEX_NAME, SEQ_IN_INDEX
+            """, (self.mysql_config['database'], table_name))
+            keys = {}
+            for index_name, column_name in cursor.fetchall():
+                keys.setdefault(index_name, []).append(column_name)
+            return list(keys.values())
+
+    def find_evolvable_table(self, columns, table_names, min_overlap=0.6, min_shared=3):
+        """在候选表（用户选择的表或由文件名得到的表）中查找与上传列最相近的表
+
+        按规范化列名计算重合度（交集/并集），重合度达到min_overlap且共有列不少于min_shared时返回
+        (表名, 表中缺少的上传列)，否则返回(None, [])。
+        """
+        table_names = [name for name in table_names if name and not name.startswith(INTERNAL_TABLE_PREFIX)]
+        if not table_names:
+            return None, []
+        try:
+            if not self.mysql_conn or not self.mysql_conn.open:
+                self.connect_mysql()
+            with self.mysql_conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT TABLE_NAME, COLUMN_NAME
+                    FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME IN ({", ".join(["%s"] * len(table_names))})
+                """, (self.mysql_config['database'], *table_names))
+                tables = {}
+                for table_name, column_name in cursor.fetchall():
+                    tables.setdefault(table_name, set()).add(normalize_column_name(column_name))
+        except Exception as e:
+            logger.error(f"Error finding table for schema evolution: {e}")
+            return None, []
+
+        incoming = {normalize_column_name(col): col for col in columns}
+        best_table, best_overlap = None, 0.0
+        for table_name, existing in tables.items():
+            if len(existing & incoming.keys()) < min_shared:
+                continue
+            overlap = len(existing & incoming.keys()) / len(existing | incoming.keys())
+            if overlap > best_overlap:
+                best_table, best_overlap = table_name, overlap
+        if best_table is None or best_overlap < min_overlap:
+            return None, []
+        missing = [col for name, col in incoming.items() if name not in tables[best_table]]
+        logger.info(f"Table {best_table} matches upload columns ({best_overlap:.0%}), missing: {missing}")
+        return best_table, missing
+
+    def _resolve_columns(self, table_name, df):
+        """将DataFrame列对应到表列：优先按规范化列名匹配，列数相同时退回按位置对应"""
+        table_columns = self.get_table_columns(table_name)
+        by_name = {normalize_column_name(col): col for col in table_columns}
+        matched = [by_name.get(normalize_column_name(col)) for col in df.columns]
+        if all(matched) and len(set(matched)) == len(matched):
+            return matched
+        if len(table_columns) == len(df.columns):
+            return table_columns
+        raise ValueError(
+            f"Columns {list(df.columns)} do not match table {table_name} columns {table_columns}"
+        )
+
+    def infer_key_columns(self, table_name, columns):
+        """推断去重键：上传列完整包含的主键/唯一索引，没有时返回[]
+
+        只使用表上真实存在的唯一约束，不根据列名或数据猜测，避免误把非键列当作合并键覆盖已有行。
+        """
+        for key in self.get_unique_keys(table_name):
+            if all(col in columns for col in key):
+                return key
+        return []
+
+    def _get_watermark(self, table_name, source):
+        with self.mysql_conn.cursor(pymysql.cursors.DictCursor) as cursor:
+            cursor.execute(
+                f"SELECT * FROM `{INGEST_WATERMARK_TABLE}` WHERE table_name = %s AND source = %s",
+                (table_name, source)
+            )
+            return cursor.fetchone()
+
+    def _set_watermark(self, cursor, table_name, source, row_offset, watermark_column, watermark_value,
+                       watermark_type=None):
+        cursor.execute(f"""
+            INSERT INTO `{INGEST_WATERMARK_TABLE}`
+                (table_name, source, row_offset, watermark_column, watermark_value, watermark_type)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE row_offset = VALUES(row_offset),
+                watermark_column = VALUES(watermark_column), watermark_value = VALUES(watermark_value),
+                watermark_type = VALUES(watermark_type)
+        """, (table_name, source, row_offset, watermark_column,
+              None if watermark_value is None else str(watermark_value), watermark_type))
+
+    def _rows_beyond_watermark(self, table_name, df, columns, source, watermark_column):
+        """增量追加：只保留高水位之后的行
 
-    def insert_from_df(self, table_name, df):
-        """Insert data from DataFrame into MySQL table without specifying column names"""
+        指定水位列时按该列的值过滤（该列为空的行无法判断先后，不导入），
+        否则按同一来源文件已导入的行数跳过。
+        """
+        watermark = self._get_watermark(table_name, source)
+        if watermark_column:
+            values = df[df.columns[columns.index(watermark_column)]]
+            present = values.notna()
+            if not present.all():
+                logger.warning(
+                    f"Skipping {int((~present).sum())} rows with empty watermark column {watermark_column} "
+                    f"for {table_name}"
+                )
+            if not watermark or watermark["watermark_value"] is None:
+                return df[present]
+            kind = watermark.get("watermark_type") or self._watermark_type(values)
+            return df[present & self._beyond_watermark(values, watermark["watermark_value"], kind)]
+        offset = watermark["row_offset"] if watermark else 0
+        return df.iloc[offset:]
+
+    @staticmethod
+    def _watermark_type(values):
+        """水位列的比较方式：非空值都是数字时按数值比较，否则按字符串比较，没有非空值时返回None"""
+        values = values.dropna()
+        if values.empty:
+            return None
+        return "numeric" if pd.to_numeric(values, errors="coerce").notna().all() else "string"
+
+    @staticmethod
+    def _watermark_keys(values, kind):
+        """按水位类型转换水位列，数值水位中出现非数字时拒绝导入"""
+        if kind == "numeric":
+            numeric = pd.to_numeric(values, errors="coerce")
+            if numeric[values.notna()].isna().any():
+                raise ValueError("Watermark column contains non-numeric values but the stored watermark is numeric")
+            return numeric
+        return values.astype(str)
+
+    @classmethod
+    def _beyond_watermark(cls, values, mark, kind):
+        """水位列的值是否大于已记录的水位（空值返回False）"""
+        keys = cls._watermark_keys(values, kind)
+        return values.notna() & (keys > (float(mark) if kind == "numeric" else str(mark)))
+
+    @classmethod
+    def _watermark_value(cls, values, kind=None):
+        """计算水位列非空值的最大值，按kind（默认根据数据判断）比较"""
+        kind = kind or cls._watermark_type(values)
+        if kind is None:
+            return None
+        return cls._watermark_keys(values, kind)[values.notna()].max()
+
+    def _merge_rows(self, cursor, table_name, columns, data, key_columns):
+        """通过临时表合并：更新已存在的行，插入新行，返回(插入数, 实际变化的更新数)"""
+        stage_table = f"{INTERNAL_TABLE_PREFIX}stage_{table_name}"[:64]
+        column_list = ", ".join(f"`{col}`" for col in columns)
+        match = " AND ".join(f"t.`{col}` <=> s.`{col}`" for col in key_columns)
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+        cursor.execute(f"CREATE TEMPORARY TABLE `{stage_table}` LIKE `{table_name}`")
+        try:
+            placeholders = ", ".join(["%s"] * len(columns))
+            cursor.executemany(
+                f"INSERT INTO `{stage_table}` ({column_list}) VALUES ({placeholders})", data
+            )
+            updated = 0
+            value_columns = [col for col in columns if col not in key_columns]
+            if value_columns:
+                assignments = ", ".join(f"t.`{col}` = s.`{col}`" for col in value_columns)
+                updated = cursor.execute(
+                    f"UPDATE `{table_name}` t JOIN `{stage_table}` s ON {match} SET {assignments}"
+                )
+            inserted = cursor.execute(f"""
+                INSERT INTO `{table_name}` ({column_list})
+                SELECT {", ".join(f"s.`{col}`" for col in columns)}
+                FROM `{stage_table}` s
+                WHERE NOT EXISTS (SELECT 1 FROM `{table_name}` t WHERE {match})
+            """)
+            return inserted, updated
+        finally:
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{stage_table}`")
+
+    def insert_from_df(self, table_name, df, session=None, mode="append", key_columns=None, source=None):
+        """Insert data from DataFrame into MySQL table
+
+        mode:
+            append: 直接追加所有行
+            upsert: 按声明的键或表的主键/唯一索引去重，通过临时表更新已存在的行并插入新行；
+                    两者都没有时按append写入
+            incremental: 只追加高水位之后的行（key_columns的第一列作为水位列，未指定时按来源文件行数）
+        """
         try:
             if not self.mysql_conn or not self.mysql_conn.open:
                 self.connect_mysql()
                 
             # Clean data - replace NaN with None (NULL in MySQL)
-            df = df.where(pd.notnull(df), None)
+            df = df.astype(object).where(pd.notnull(df), None)
             logger.info(f"Cleaned data for table {table_name}: {df.head().to_dict()}")
-                
+
+            columns = self._resolve_columns(table_name, df)
+            if key_columns:
+                by_name = {normalize_column_name(col): col for col in columns}
+                key_columns = [by_name.get(normalize_column_name(col)) for col in key_columns]
+                if not all(key_columns):
+                    raise ValueError(f"Key columns not found in table {table_name}")
+
+            if mode != "append":
+                self._ensure_ingest_tables()
+            total_rows = len(df)
+            if mode == "incremental":
+                watermark_column = key_columns[0] if key_columns else None
+                df = self._rows_beyond_watermark(table_name, df, columns, source or table_name, watermark_column)
+                logger.info(f"Incremental load for {table_name}: {len(df)} of {total_rows} rows beyond watermark")
+            elif mode == "upsert" and not key_columns:
+                key_columns = self.infer_key_columns(table_name, columns)
+                if not key_columns:
+                    # 没有声明的键也没有唯一索引时无法判断哪些行是同一行，按追加写入
+                    logger.info(f"No key declared and no unique index on {table_name}, appending rows")
+                    mode = "append"
+            if mode == "upsert":
+                # 声明的键包含某个唯一索引时按该唯一索引合并，避免插入时唯一键冲突
+                for unique_key in self.get_unique_keys(table_name):
+                    if key_columns and set(unique_key) <= set(key_columns):
+                        key_columns = unique_key
+                        break
+                df = df.drop_duplicates(subset=[df.columns[columns.index(col)] for col in key_columns], keep="last")
+                logger.info(f"Upsert into {table_name} on key {key_columns}")
+
             # Create SQL placeholders
-            placeholders = ', '.join(['%s'] * len(df.columns))
-            sql = f"INSERT INTO {table_name} VALUES ({placeholders})"
+            column_list = ", ".join(f"`{col}`" for col in columns)
+            placeholders = ', '.join(['%s'] * len(columns))
+            sql = f"INSERT INTO `{table_name}` ({column_list}) VALUES ({placeholders})"
             
             # Convert DataFrame to list of tuples
             data = [tuple(row) for row in df.values]
+            inserted, updated = len(data), 0
             
             # Execute batch insert
+            self.mysql_conn.begin()
             with self.mysql_conn.cursor() as cursor:
-                cursor.executemany(sql, data)
+                if data and mode == "upsert":
+                    # 通过临时表合并，可以准确区分新增行和实际变化的行
+                    inserted, updated = self._merge_rows(cursor, table_name, columns, data, key_columns)
+                elif data:
+                    cursor.executemany(sql, data)
+                if mode == "incremental":
+                    watermark = self._get_watermark(table_name, source or table_name)
+                    row_offset = total_rows if not key_columns else (watermark["row_offset"] if watermark else 0)
+                    watermark_value = watermark["watermark_value"] if watermark else None
+                    watermark_type = watermark.get("watermark_type") if watermark else None
+                    if key_columns and data:
+                        values = df[df.columns[columns.index(key_columns[0])]]
+                        # 第一次确定的比较方式会保存下来，之后的上传按同样的方式比较
+                        watermark_type = watermark_type or self._watermark_type(values)
+                        watermark_value = self._watermark_value(values, watermark_type)
+                    self._set_watermark(
+                        cursor, table_name, source or table_name, row_offset,
+                        key_columns[0] if key_columns else None, watermark_value, watermark_type
+                    )
+                if data:
+                    # 与插入在同一事务中通知，便于增量维护派生数据
+                    self._notify_write_observers({
+                        "table_name": table_name,
+                        "mode": mode,
+                        "columns": columns,
+                        "rows": data,
+                        "cursor": cursor
+                    })
                 self.mysql_conn.commit()
-                logger.info(f"Inserted {len(data)} rows into {table_name}")
+                self.mark_write(session)
+                logger.info(f"Inserted {inserted} rows, updated {updated} rows in {table_name}")
                 return {
                     "status": "success",
-                    "operation": "insert",
+                    "operation": mode if mode != "append" else "insert",
                     "table_name": table_name,
-                    "row_count": len(data),
-                    "message": f"Successfully inserted {len(data)} rows into {table_name}"
+                    "row_count": inserted,
+                    "updated_count": updated,
+                    "message": f"Successfully inserted {inserted} rows and updated {updated} rows in {table_name}"
                 }
                 
         except Exception as e:
+            if self.mysql_conn and self.mysql_conn.open:
+                self.mysql_conn.rollback()
             logger.error(f"Error inserting data into {table_name}: {e}")
             return {
                 "status": "error",
-                "operation": "insert",
+                "operation": mode if mode != "append" else "insert",
                 "table_name": table_name,
                 "message": str(e)
             }
@@ -0,0 +1,413 @@
+import hashlib
+import json
+import re
+import threading
+import pymysql
+from config import INDEX_ADVISOR_MODE
+from config import INDEX_ADVISOR_INTERVAL
+from config import INDEX_ADVISOR_MAX_INDEXES_PER_TABLE
+from config import INDEX_ADVISOR_MIN_QUERIES
+from config import INDEX_ADVISOR_MIN_BENEFIT
+from config import INDEX_ADVISOR_TOP_N
+from config import INDEX_ADVISOR_MAX_EVALUATIONS
+from config import INDEX_ADVISOR_LOCK_WAIT_TIMEOUT
+from database import DatabaseManager
+from database import INTERNAL_TABLE_PREFIX
+from logger import get_logger
+from shared_store import get_shared_store
+
+logger = get_logger()
+
+# 索引顾问创建的索引名前缀
+INDEX_PREFIX = "idx_chatdb_"
+# 组合索引最多包含的列数
+MAX_INDEX_COLUMNS = 3
+# 每个候选索引保留的样本SQL数量，用于EXPLAIN对比
+MAX_SAMPLE_QUERIES = 3
+# 等待元数据锁超时
+ER_LOCK_WAIT_TIMEOUT = 1205
+
+IDENTIFIER = r"`?([A-Za-z_][\w$]*)`?"
+TABLE_REF_PATTERN = re.compile(rf"\b(?:FROM|JOIN)\s+{IDENTIFIER}(?:\s+(?:AS\s+)?{IDENTIFIER})?", re.IGNORECASE)
+COLUMN_REF_PATTERN = re.compile(rf"^(?:{IDENTIFIER}\.)?{IDENTIFIER}$")
+# 可以使用索引的过滤条件：等值在前，范围条件放在组合索引的最后
+EQUALITY_PATTERN = re.compile(
+    rf"(?<![\w.'\"`])(?:{IDENTIFIER}\.)?{IDENTIFIER}\s*(?:<=>|=|\bIN\b)", re.IGNORECASE
+)
+RANGE_PATTERN = re.compile(
+    rf"(?<![\w.'\"`])(?:{IDENTIFIER}\.)?{IDENTIFIER}\s*(?:>=|<=|(?<![<!])>|<(?![=>])|\bBETWEEN\b)", re.IGNORECASE
+)
+JOIN_PREDICATE_PATTERN = re.compile(rf"{IDENTIFIER}\.{IDENTIFIER}\s*=\s*{IDENTIFIER}\.{IDENTIFIER}")
+CLAUSE_END = r"(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|\Z)"
+WHERE_PATTERN = re.compile(rf"\bWHERE\b(.*?){CLAUSE_END}", re.IGNORECASE | re.DOTALL)
+ON_PATTERN = re.compile(
+    r"\bON\b(.*?)(?=\b(?:LEFT|RIGHT|INNER|CROSS|OUTER)?\s*JOIN\b|\bWHERE\b|\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\Z)",
+    re.IGNORECASE | re.DOTALL
+)
+GROUP_BY_PATTERN = re.compile(r"\bGROUP\s+BY\b(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|\Z)", re.IGNORECASE | re.DOTALL)
+ORDER_BY_PATTERN = re.compile(r"\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|\Z)", re.IGNORECASE | re.DOTALL)
+SQL_KEYWORDS = {
+    "where", "on", "using", "join", "left", "right", "inner", "outer", "cross", "natural",
+    "group", "order", "limit", "having", "union", "and", "or", "not", "null", "is", "in",
+    "as", "select", "from", "set", "straight_join", "window", "for", "lock"
+}
+
+def _resolve(alias_map, tables, qualifier, column):
+    """将列引用解析为(候选表, 列名)，无法确定具体表时保留查询涉及的所有表"""
+    if column.lower() in SQL_KEYWORDS:
+        return None
+    if qualifier:
+        table = alias_map.get(qualifier.lower())
+        return ((table,), column) if table else None
+    return (tables, column)
+
+def _column_list(alias_map, tables, text):
+    """解析GROUP BY/ORDER BY中的列引用，遇到表达式时返回None"""
+    refs = []
+    for item in text.split(","):
+        item = re.sub(r"\s+(?:ASC|DESC)\s*$", "", item.strip(), flags=re.IGNORECASE)
+        match = COLUMN_REF_PATTERN.match(item)
+        if not match:
+            return None
+        ref = _resolve(alias_map, tables, match.group(1), match.group(2))
+        if not ref:
+            return None
+        refs.append(ref)
+    return refs
+
+def _group_by_table(refs):
+    """按表分组列引用，得到(候选表, 列元组)形式的组合索引候选"""
+    grouped = {}
+    for tables, column in refs:
+        columns = grouped.setdefault(tables, [])
+        if column not in columns:
+            columns.append(column)
+    return [(tables, tuple(columns[:MAX_INDEX_COLUMNS])) for tables, columns in grouped.items()]
+
+def extract_index_candidates(query):
+    """从SQL中提取索引候选：WHERE等值/范围列、JOIN列、GROUP BY列、ORDER BY列"""
+    alias_map = {}
+    tables = []
+    for match in TABLE_REF_PATTERN.finditer(query):
+        table, alias = match.group(1), match.group(2)
+        if table.lower() in SQL_KEYWORDS:
+            continue
+        alias_map[table.lower()] = table
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            alias_map[alias.lower()] = table
+        if table not in tables:
+            tables.append(table)
+    if not tables:
+        return []
+    tables = tuple(tables)
+
+    candidates = []
+    where = WHERE_PATTERN.search(query)
+    if where:
+        clause = where.group(1)
+        equality = [
+            ref for ref in (_resolve(alias_map, tables, m.group(1), m.group(2)) for m in EQUALITY_PATTERN.finditer(clause))
+            if ref
+        ]
+        ranges = [
+            ref for ref in (_resolve(alias_map, tables, m.group(1), m.group(2)) for m in RANGE_PATTERN.finditer(clause))
+            if ref and ref not in equality
+        ]
+        # 每个表的等值列后接第一个范围列
+        for table_key, columns in _group_by_table(equality + ranges[:1]):
+            candidates.append((table_key, columns))
+    for on in ON_PATTERN.finditer(query):
+        for m in JOIN_PREDICATE_PATTERN.finditer(on.group(1)):
+            for qualifier, column in ((m.group(1), m.group(2)), (m.group(3), m.group(4))):
+                ref = _resolve(alias_map, tables, qualifier, column)
+                if ref:
+                    candidates.append((ref[0], (ref[1],)))
+    for pattern in (GROUP_BY_PATTERN, ORDER_BY_PATTERN):
+        clause = pattern.search(query)
+        refs = _column_list(alias_map, tables, clause.group(1)) if clause else None
+        if refs:
+            candidates.extend(_group_by_table(refs))
+    return list(dict.fromkeys(candidates))
+
+def index_name(columns):
+    """生成不超过64字符的索引名"""
+    name = INDEX_PREFIX + "_".join(columns)
+    if len(name) > 64:
+        digest = hashlib.md5(name.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:55]}_{digest}"
+    return name
+
+class IndexAdvisor:
+    """根据生成SQL的工作负载推荐并在线创建二级索引
+
+    记录每条执行成功的生成SQL中的过滤、关联、分组和排序列及其耗时，
+    每轮按累计耗时取前INDEX_ADVISOR_MAX_EVALUATIONS个候选评估，再按估算收益排序保留前INDEX_ADVISOR_TOP_N个。
+    mode为report时只EXPLAIN样本SQL估算当前代价，不执行DDL；
+    为evaluate时先以INVISIBLE方式创建索引，对比样本SQL在使用索引前后的EXPLAIN代价后删除；
+    为apply时将排名靠前且收益足够的索引设为可见，其余删除。
+    索引DDL等待元数据锁超过INDEX_ADVISOR_LOCK_WAIT_TIMEOUT时放弃本轮，下一轮重试。
+    多worker部署时所有worker都记录工作负载，只在一个worker上运行分析。
+    """
+    def __init__(self, mode=INDEX_ADVISOR_MODE, interval=INDEX_ADVISOR_INTERVAL,
+                 max_indexes_per_table=INDEX_ADVISOR_MAX_INDEXES_PER_TABLE):
+        self.mode = mode
+        self.interval = interval
+        self.max_indexes_per_table = max_indexes_per_table
+        # 使用独立的主库连接，避免与请求线程共享连接
+        self.db_manager = DatabaseManager(replica_configs=[])
+        self.recommendations = []
+        # 工作负载统计保存在共享存储中，所有worker的查询都会被统计
+        self.store = get_shared_store()
+        self._evaluated = set()
+        # 因锁等待超时未能删除的评估索引，下一轮重试
+        self._pending_drops = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, query, elapsed, session=None):
+        """query observer：记录一次生成SQL的执行"""
+        for tables, columns in extract_index_candidates(query):
+            key = json.dumps([list(tables), list(columns)])
+            self.store.incr("index_workload_count", key)
+            self.store.incr("index_workload_latency", key, elapsed)
+            samples = self.store.get("index_workload_samples", key, [])
+            if query not in samples:
+                self.store.set("index_workload_samples", key, (samples + [query])[-MAX_SAMPLE_QUERIES:])
+
+    def start(self):
+        if self.mode == "off" or self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="index-advisor", daemon=True)
+        self._thread.start()
+        logger.info(f"Index advisor started in {self.mode} mode, interval {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.analyze()
+            except Exception as e:
+                logger.error(f"Index advisor error: {e}")
+
+    def _connection(self):
+        if not self.db_manager.mysql_conn or not self.db_manager.mysql_conn.open:
+            self.db_manager.connect_mysql()
+            # 索引DDL需要短暂的排他元数据锁，等待期间会阻塞该表的新查询，不能长时间排队
+            with self.db_manager.mysql_conn.cursor() as cursor:
+                cursor.execute("SET SESSION lock_wait_timeout = %s", (INDEX_ADVISOR_LOCK_WAIT_TIMEOUT,))
+        return self.db_manager.mysql_conn
+
+    def _ranked_candidates(self):
+        """解析候选表并按累计耗时排序"""
+        latencies = self.store.counters("index_workload_latency")
+        workload = {}
+        for key, count in self.store.counters("index_workload_count").items():
+            tables, columns = json.loads(key)
+            workload[(tuple(tables), tuple(columns))] = {
+                "count": count,
+                "total_latency": latencies.get(key, 0.0),
+                "queries": self.store.get("index_workload_samples", key, [])
+            }
+        merged = {}
+        columns_cache = {}
+        self._connection()
+        for (tables, columns), stats in workload.items():
+            table = None
+            for candidate in tables:
+                if candidate.startswith(INTERNAL_TABLE_PREFIX):
+                    continue
+                if candidate not in columns_cache:
+                    columns_cache[candidate] = {c.lower(): c for c in self.db_manager.get_table_columns(candidate)}
+                if all(col.lower() in columns_cache[candidate] for col in columns):
+                    table = candidate
+                    break
+            if not table:
+                continue
+            columns = tuple(columns_cache[table][col.lower()] for col in columns)
+            entry = merged.setdefault((table, columns), {"count": 0, "total_latency": 0.0, "queries": []})
+            entry["count"] += stats["count"]
+            entry["total_latency"] += stats["total_latency"]
+            entry["queries"] = list(dict.fromkeys(entry["queries"] + stats["queries"]))[-MAX_SAMPLE_QUERIES:]
+        ranked = [
+            (key, stats) for key, stats in merged.items()
+            if stats["count"] >= INDEX_ADVISOR_MIN_QUERIES and key not in self._evaluated
+        ]
+        return sorted(ranked, key=lambda item: item[1]["total_latency"], reverse=True)
+
+    def _existing_indexes(self, table):
+        """返回表上的二级索引：索引名 -> 列列表"""
+        with self._connection().cursor() as cursor:
+            cursor.execute("""
+                SELECT INDEX_NAME, COLUMN_NAME
+                FROM INFORMATION_SCHEMA.STATISTICS
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME <> 'PRIMARY'
+                ORDER BY INDEX_NAME, SEQ_IN_INDEX
+            """, (self.db_manager.mysql_config['database'], table))
+            indexes = {}
+            for name, column in cursor.fetchall():
+                indexes.setdefault(name, []).append(column)
+            return indexes
+
+    def _explain_cost(self, queries, use_invisible_indexes=False):
+        """样本SQL的EXPLAIN估算代价之和"""
+        total = 0.0
+        with self._connection().cursor() as cursor:
+            if use_invisible_indexes:
+                cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=on'")
+            try:
+                for query in queries:
+                    cursor.execute(f"EXPLAIN FORMAT=JSON {query}")
+                    plan = json.loads(cursor.fetchone()[0])
+                    total += float(plan["query_block"].get("cost_info", {}).get("query_cost", 0))
+            finally:
+                if use_invisible_indexes:
+                    cursor.execute("SET SESSION optimizer_switch = 'use_invisible_indexes=off'")
+        return total
+
+    def _evaluate(self, table, columns, stats):
+        """以不可见索引评估候选索引的收益
+
+        apply模式下收益足够的不可见索引先保留，本轮排序后再决定设为可见还是删除。
+        """
+        name = index_name(columns)
+        column_list = ", ".join(f"`{col}`" for col in columns)
+        before = self._explain_cost(stats["queries"])
+        with self._connection().cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE `{table}` ADD INDEX `{name}` ({column_list}) INVISIBLE, ALGORITHM=INPLACE, LOCK=NONE"
+            )
+        try:
+            after = self._explain_cost(stats["queries"], use_invisible_indexes=True)
+        except Exception:
+            self._drop_index(table, name)
+            raise
+        benefit = (before - after) / before if before > 0 else 0.0
+        recommendation = {
+            "table_name": table,
+            "columns": list(columns),
+            "index_name": name,
+            "query_count": stats["count"],
+            "total_latency": round(stats["total_latency"], 3),
+            "cost_before": before,
+            "cost_after": after,
+            "benefit": round(benefit, 3),
+            "applied": False
+        }
+        if benefit < INDEX_ADVISOR_MIN_BENEFIT or self.mode != "apply":
+            self._drop_index(table, name)
+        return recommendation
+
+    def _apply(self, recommendation):
+        """将评估时保留的不可见索引设为可见，失败时删除"""
+        table, name = recommendation["table_name"], recommendation["index_name"]
+        try:
+            with self._connection().cursor() as cursor:
+                cursor.execute(f"ALTER TABLE `{table}` ALTER INDEX `{name}` VISIBLE")
+        except pymysql.err.MySQLError as e:
+            logger.error(f"Error applying index {name} on {table}: {e}")
+            self._discard(recommendation)
+            return
+        recommendation["applied"] = True
+        logger.info(
+            f"Applied index {name} on {table}{recommendation['columns']}, "
+            f"estimated benefit {recommendation['benefit']:.0%}"
+        )
+
+    def _discard(self, recommendation):
+        """删除评估时保留但未被采用的不可见索引"""
+        try:
+            self._drop_index(recommendation["table_name"], recommendation["index_name"])
+        except pymysql.err.MySQLError as e:
+            logger.error(f"Error dropping evaluation index {recommendation['index_name']}: {e}")
+
+    @staticmethod
+    def _score(recommendation):
+        """排序依据：评估得到的收益比例×累计耗时；report模式没有实测收益，用当前估算代价×执行次数"""
+        if "benefit" in recommendation:
+            return recommendation["benefit"] * recommendation["total_latency"]
+        return recommendation["cost_before"] * recommendation["query_count"]
+
+    def _drop_index(self, table, name):
+        try:
+            with self._connection().cursor() as cursor:
+                cursor.execute(f"ALTER TABLE `{table}` DROP INDEX `{name}`, ALGORITHM=INPLACE, LOCK=NONE")
+            self._pending_drops.discard((table, name))
+        except pymysql.err.MySQLError as e:
+            if e.args and e.args[0] == ER_LOCK_WAIT_TIMEOUT:
+                logger.warning(f"Lock wait timeout dropping index {name} on {table}, retrying next round")
+                self._pending_drops.add((table, name))
+            raise
+
+    def _report(self, table, columns, stats):
+        """report模式：EXPLAIN样本SQL估算当前代价，不执行DDL"""
+        return {
+            "table_name": table,
+            "columns": list(columns),
+            "index_name": index_name(columns),
+            "query_count": stats["count"],
+            "total_latency": round(stats["total_latency"], 3),
+            "cost_before": self._explain_cost(stats["queries"]),
+            "applied": False
+        }
+
+    def analyze(self):
+        """评估排名靠前的候选索引，按估算收益排序，返回本轮的推荐结果"""
+        for table, name in list(self._pending_drops):
+            try:
+                self._drop_index(table, name)
+            except pymysql.err.MySQLError as e:
+                logger.error(f"Error dropping evaluation index {name} on {table}: {e}")
+                return []
+        candidates = []
+        evaluations = 0
+        for (table, columns), stats in self._ranked_candidates():
+            # 每次评估都是一次完整的索引构建，限制每轮的评估次数
+            if evaluations >= INDEX_ADVISOR_MAX_EVALUATIONS:
+                break
+            self._evaluated.add((table, columns))
+            indexes = self._existing_indexes(table)
+            # 已有索引以这些列为前缀时无需再建
+            if any(tuple(existing[:len(columns)]) == columns for existing in indexes.values()):
+                continue
+            if len(indexes) >= self.max_indexes_per_table:
+                logger.info(f"Table {table} already has {len(indexes)} indexes, skipping {list(columns)}")
+                continue
+            evaluations += 1
+            try:
+                if self.mode == "report":
+                    candidates.append(self._report(table, columns, stats))
+                    continue
+                recommendation = self._evaluate(table, columns, stats)
+            except pymysql.err.MySQLError as e:
+                if e.args and e.args[0] == ER_LOCK_WAIT_TIMEOUT:
+                    # 表上有长时间运行的查询或事务，放弃本轮，下一轮重新评估该候选
+                    logger.warning(f"Lock wait timeout evaluating index on {table}{list(columns)}, skipping this round")
+                    self._evaluated.discard((table, columns))
+                    break
+                logger.error(f"Error evaluating index on {table}{list(columns)}: {e}")
+                continue
+            if recommendation["benefit"] >= INDEX_ADVISOR_MIN_BENEFIT:
+                candidates.append(recommendation)
+
+        candidates.sort(key=self._score, reverse=True)
+        results = candidates[:INDEX_ADVISOR_TOP_N]
+        for recommendation in results:
+            if self.mode == "apply":
+                self._apply(recommendation)
+            else:
+                detail = (
+                    f"estimated benefit {recommendation['benefit']:.0%}" if "benefit" in recommendation
+                    else f"estimated cost {recommendation['cost_before']:.1f}"
+                )
+                logger.info(
+                    f"Recommended index on {recommendation['table_name']}{recommendation['columns']}: {detail}, "
+                    f"{recommendation['query_count']} queries, {recommendation['total_latency']:.2f}s total"
+                )
+        if self.mode == "apply":
+            for recommendation in candidates[INDEX_ADVISOR_TOP_N:]:
+                self._discard(recommendation)
+        if results:
+            self.recommendations = (self.recommendations + results)[-50:]
+        return results
@@ -2,6 +2,9 @@ import logging
 import os
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
+from config import CHATDB_WORKERS
+from config import CHATDB_WORKER_ID
+from config import LOG_DIR
 
 class Logger:
     _instance = None
@@ -15,13 +18,16 @@ class Logger:
     def _initialize_logger(self):
         """Initialize the logger with custom configuration"""
         # Create logs directory if it doesn't exist
-        log_dir = "/app/logs"
+        log_dir = LOG_DIR
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
             
         # Generate log filename with current date
         current_date = datetime.now().strftime("%Y-%m-%d")
         log_file = os.path.join(log_dir, f"nlp2sql_{current_date}.log")
+        if CHATDB_WORKERS > 1:
+            # 每个worker进程单独写日志文件，避免多进程轮转同一个文件
+            log_file = os.path.join(log_dir, f"nlp2sql_{current_date}_worker{CHATDB_WORKER_ID}.log")
         
         # Create logger
         self.logger = logging.getLogger("NLP2SQL")
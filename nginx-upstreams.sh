@@ -0,0 +1,22 @@
+#!/bin/sh
+# Run by the nginx image entrypoint (/docker-entrypoint.d) before nginx starts.
+# Writes one upstream server per app worker started by serve.py, so the
+# upstream list in nginx.conf always matches CHATDB_WORKERS.
+set -eu
+
+workers=${CHATDB_WORKERS:-1}
+base_port=${WORKER_BASE_PORT:-8861}
+out=/etc/nginx/chatdb_upstreams.conf
+
+: > "$out"
+if [ "$workers" -le 1 ]; then
+    # serve.py runs a single app process on SERVER_PORT
+    echo "server app:${SERVER_PORT:-8860};" >> "$out"
+else
+    i=0
+    while [ "$i" -lt "$workers" ]; do
+        echo "server app:$((base_port + i));" >> "$out"
+        i=$((i + 1))
+    done
+fi
+echo "chatdb: generated $(wc -l < "$out") upstream server(s) in $out"
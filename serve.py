@@ -0,0 +1,58 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from config import CHATDB_WORKERS
+from config import WORKER_BASE_PORT
+from logger import get_logger
+
+logger = get_logger()
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+def start_worker(worker_id):
+    """启动一个worker进程，端口为WORKER_BASE_PORT + worker_id"""
+    env = dict(os.environ, CHATDB_WORKER_ID=str(worker_id))
+    process = subprocess.Popen([sys.executable, APP_PATH], env=env)
+    logger.info(f"Started worker {worker_id} (pid {process.pid}) on port {WORKER_BASE_PORT + worker_id}")
+    return process
+
+def main():
+    """启动CHATDB_WORKERS个worker进程，worker异常退出时自动重启
+
+    worker之间通过共享存储（SQLite WAL）共享缓存和指标，
+    由前置代理（见nginx.conf）按客户端IP粘性转发到各worker。
+    """
+    if CHATDB_WORKERS <= 1:
+        os.execv(sys.executable, [sys.executable, APP_PATH])
+
+    workers = {worker_id: start_worker(worker_id) for worker_id in range(CHATDB_WORKERS)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info(f"Received signal {signum}, stopping workers")
+        for process in workers.values():
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        for worker_id, process in list(workers.items()):
+            if process.poll() is not None and not stopping:
+                logger.error(f"Worker {worker_id} exited with code {process.returncode}, restarting")
+                workers[worker_id] = start_worker(worker_id)
+        time.sleep(1)
+
+    for process in workers.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    logger.info("All workers stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import SHARED_STORE_PATH
+from logger import get_logger
+
+logger = get_logger()
+
+# 写入时清理过期键的最小间隔（秒）
+PURGE_INTERVAL = 300
+
+class SharedStore:
+    """多个worker进程共享的本地键值存储（SQLite WAL模式）
+
+    用于schema缓存、查询/结果缓存、指标计数等需要在进程间保持一致的状态。
+    每个线程使用独立的SQLite连接，fork之后自动重新连接。
+    """
+    def __init__(self, path=SHARED_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._purged_at = time.time()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key, default=None):
+        """读取值，不存在或已过期时返回default"""
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Shared store read error ({namespace}): {e}")
+            return default
+        if not row or (row[1] is not None and row[1] < time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """写入值，ttl为过期秒数"""
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, default=str), expires_at)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Shared store write error ({namespace}): {e}")
+        # 缓存键包含写入代数，旧键不会再被读取或覆盖，需要定期删除
+        if time.time() - self._purged_at > PURGE_INTERVAL:
+            self._purged_at = time.time()
+            self.purge_expired()
+
+    def add(self, namespace, key, value, ttl=None):
+        """仅当键不存在（或已过期）时写入，返回是否写入成功，可用作跨进程的互斥标记"""
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM kv WHERE namespace = ? AND key = ? AND expires_at < ?",
+                    (namespace, key, time.time())
+                )
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, default=str), expires_at)
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error(f"Shared store write error ({namespace}): {e}")
+            return False
+
+    def delete(self, namespace, key=None):
+        """删除单个键，key为None时清空整个命名空间"""
+        try:
+            if key is None:
+                self._conn().execute("DELETE FROM kv WHERE namespace = ?", (namespace,))
+            else:
+                self._conn().execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            logger.error(f"Shared store delete error ({namespace}): {e}")
+
+    def purge_expired(self):
+        try:
+            self._conn().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.error(f"Shared store purge error: {e}")
+
+    def incr(self, namespace, key, amount=1):
+        """原子地累加计数器，返回累加后的值"""
+        try:
+            row = self._conn().execute("""
+                INSERT INTO counters (namespace, key, value) VALUES (?, ?, ?)
+                ON CONFLICT(namespace, key) DO UPDATE SET value = value + excluded.value
+                RETURNING value
+            """, (namespace, key, amount)).fetchone()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Shared store counter error ({namespace}): {e}")
+            return 0
+
+    def counter(self, namespace, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM counters WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Shared store counter error ({namespace}): {e}")
+            return 0
+        return row[0] if row else 0
+
+    def counters(self, namespace):
+        """返回命名空间下的所有计数器"""
+        try:
+            rows = self._conn().execute(
+                "SELECT key, value FROM counters WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Shared store counter error ({namespace}): {e}")
+            return {}
+        return dict(rows)
+
+    def reset_counter(self, namespace, key):
+        try:
+            self._conn().execute("DELETE FROM counters WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            logger.error(f"Shared store counter error ({namespace}): {e}")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_shared_store():
+    """获取当前进程的共享存储实例"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SharedStore()
+        return _store
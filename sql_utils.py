@@ -1,7 +1,16 @@
 import re
 from typing import List
 import pandas as pd
+import pymysql
 from database import DatabaseManager
+from logger import get_logger
+
+logger = get_logger()
+
+# ALGORITHM=INSTANT不支持时MySQL返回的错误码：
+# 1845/1846该操作不支持INSTANT，1800 MySQL 8.0.12之前不认识INSTANT，
+# 4092 MySQL 8.0.29+表的INSTANT行版本数已达上限
+ER_ALTER_OPERATION_NOT_SUPPORTED = (1800, 1845, 1846, 4092)
 
 def extract_sql(text: str) -> str:
     """
@@ -66,19 +75,23 @@ def extract_table_name(sql: str) -> str:
         return match.group(1) or match.group(2)
     return None
 
-def add_columns_to_table(table_name: str, columns: List[str], dtypes: List[str]) -> bool:
+def add_columns_to_table(table_name: str, columns: List[str], dtypes: List[str], db_manager: DatabaseManager = None) -> bool:
     """
     向现有表添加新列
     
+    所有列合并为一条ALTER TABLE语句，优先使用ALGORITHM=INSTANT在线添加，
+    不支持时（MySQL 8.0.12之前或表格式限制）退回默认算法。
+    
     Args:
         table_name: 表名
         columns: 要添加的列名列表
         dtypes: 列类型列表
+        db_manager: 使用的数据库连接，默认新建
         
     Returns:
         bool: 是否添加成功
     """
-    db_manager = DatabaseManager()
+    db_manager = db_manager or DatabaseManager()
     
     # 映射pandas dtype到MySQL类型
     type_mapping = {
@@ -101,7 +114,13 @@ def add_columns_to_table(table_name: str, columns: List[str], dtypes: List[str])
         
     alter_sql = f"""
     ALTER TABLE `{table_name}`
-    {', '.join(alter_statements)};
+    {', '.join(alter_statements)}
     """
     
-    return db_manager.execute_mysql_query(alter_sql)
+    try:
+        return bool(db_manager.execute_mysql_query(f"{alter_sql}, ALGORITHM=INSTANT"))
+    except pymysql.err.MySQLError as e:
+        if not e.args or e.args[0] not in ER_ALTER_OPERATION_NOT_SUPPORTED:
+            raise
+        logger.info(f"ALGORITHM=INSTANT not supported for {table_name}, using default algorithm: {e}")
+    return bool(db_manager.execute_mysql_query(alter_sql))
@@ -0,0 +1,506 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from config import SUMMARY_TABLE_MIN_HITS
+from config import SUMMARY_TABLE_MAX
+from config import SUMMARY_TABLE_REGISTRY_TTL
+from database import DatabaseManager
+from database import INTERNAL_TABLE_PREFIX
+from logger import get_logger
+from shared_store import get_shared_store
+
+logger = get_logger()
+
+SUMMARY_REGISTRY_TABLE = f"{INTERNAL_TABLE_PREFIX}summary_tables"
+SUMMARY_TABLE_PREFIX = f"{INTERNAL_TABLE_PREFIX}summary_"
+
+# 支持物化的聚合查询：单表、可选WHERE、GROUP BY、可选ORDER BY/LIMIT
+AGGREGATE_QUERY_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+`?(?P<table>[A-Za-z_][\w$]*)`?"
+    r"(?:\s+(?:AS\s+)?(?!WHERE\b|GROUP\b)`?(?P<alias>[A-Za-z_][\w$]*)`?)?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+(?:\s*,\s*\d+)?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+UNSUPPORTED_PATTERN = re.compile(r"\bJOIN\b|\bHAVING\b|\bUNION\b|\bDISTINCT\b|\(\s*SELECT\b|\bWITH\s+ROLLUP\b", re.IGNORECASE)
+COLUMN_PATTERN = re.compile(r"^`?([A-Za-z_][\w$]*)`?$")
+AGGREGATE_PATTERN = re.compile(r"^(COUNT|SUM|MIN|MAX|AVG)\s*\(\s*(\*|`?[A-Za-z_][\w$]*`?)\s*\)$", re.IGNORECASE)
+ALIAS_PATTERN = re.compile(r"^(?P<expr>.+?)\s+(?:AS\s+)?`?(?P<alias>[A-Za-z_][\w$]*|[^`]+)`?$", re.IGNORECASE | re.DOTALL)
+DIRECTION_PATTERN = re.compile(r"\s+(ASC|DESC)\s*$", re.IGNORECASE)
+# 结果随时间、会话或随机数变化的过滤条件不能物化：汇总表中的行不会随之过期
+NONDETERMINISTIC_PATTERN = re.compile(
+    r"\b(?:NOW|CURDATE|CURTIME|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|CURRENT_USER|LOCALTIME|LOCALTIMESTAMP"
+    r"|SYSDATE|UTC_DATE|UTC_TIME|UTC_TIMESTAMP|UNIX_TIMESTAMP|RAND|UUID|UUID_SHORT|CONNECTION_ID|USER"
+    r"|DATABASE|LAST_INSERT_ID|FOUND_ROWS|ROW_COUNT)\b|@",
+    re.IGNORECASE
+)
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+# 建表标记的过期时间（秒），建表进程异常退出后其他worker可以重新建表
+SUMMARY_BUILD_CLAIM_TTL = 3600
+# 不影响汇总数据的语句
+IGNORED_STATEMENT_PATTERN = re.compile(r"^\s*(?:ALTER|CREATE)\b", re.IGNORECASE)
+
+def split_top_level(text, sep=","):
+    """按顶层分隔符切分（忽略括号和引号内的分隔符）"""
+    parts, depth, quote, current = [], 0, None, []
+    for ch in text:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current).strip())
+    return parts
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+def _quote_label(label):
+    return "`" + label.replace("`", "``") + "`"
+
+def parse_aggregate_query(query):
+    """解析可物化的聚合查询，不支持的查询返回None"""
+    match = AGGREGATE_QUERY_PATTERN.match(query)
+    if not match or UNSUPPORTED_PATTERN.search(query):
+        return None
+    table = match.group("table")
+    if table.startswith(INTERNAL_TABLE_PREFIX):
+        return None
+    qualifiers = {table.lower()}
+    if match.group("alias"):
+        qualifiers.add(match.group("alias").lower())
+
+    def strip_qualifiers(text):
+        return re.sub(
+            r"`?\b([A-Za-z_][\w$]*)`?\.(?=`?[A-Za-z_])",
+            lambda m: "" if m.group(1).lower() in qualifiers else m.group(0),
+            text
+        )
+
+    groups = []
+    for item in split_top_level(strip_qualifiers(match.group("group"))):
+        column = COLUMN_PATTERN.match(item)
+        if not column:
+            return None
+        groups.append(column.group(1))
+
+    items, aggregates = [], []
+    for raw in split_top_level(match.group("select")):
+        expr, label = raw, None
+        if not AGGREGATE_PATTERN.match(strip_qualifiers(raw)) and not COLUMN_PATTERN.match(strip_qualifiers(raw)):
+            aliased = ALIAS_PATTERN.match(raw)
+            if not aliased:
+                return None
+            expr, label = aliased.group("expr").strip(), aliased.group("alias")
+        stripped = strip_qualifiers(expr)
+        column = COLUMN_PATTERN.match(stripped)
+        aggregate = AGGREGATE_PATTERN.match(stripped)
+        if column:
+            if column.group(1).lower() not in [g.lower() for g in groups]:
+                return None
+            name = column.group(1)
+            items.append({"kind": "group", "column": name, "expr": expr, "label": label or name})
+        elif aggregate:
+            func, arg = aggregate.group(1).upper(), aggregate.group(2).strip("`")
+            key = {"func": func, "arg": arg}
+            if key not in aggregates:
+                aggregates.append(key)
+            items.append({"kind": "aggregate", **key, "expr": expr, "label": label or expr})
+        else:
+            return None
+
+    where = match.group("where")
+    if where and NONDETERMINISTIC_PATTERN.search(STRING_LITERAL_PATTERN.sub("''", where)):
+        return None
+    return {
+        "base_table": table,
+        "where": strip_qualifiers(where).strip() if where else None,
+        "groups": groups,
+        "aggregates": sorted(aggregates, key=lambda a: (a["func"], a["arg"])),
+        "items": items,
+        "order": match.group("order"),
+        "limit": match.group("limit"),
+    }
+
+def summary_id(parsed):
+    """相同基表、过滤条件、分组列和聚合集合的查询共用一张汇总表"""
+    key = json.dumps([
+        parsed["base_table"].lower(),
+        parsed["where"],
+        [g.lower() for g in parsed["groups"]],
+        parsed["aggregates"]
+    ])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()[:16]
+
+def summary_columns(spec):
+    """汇总表的聚合列：COUNT/SUM/AVG保存可累加的和与计数，MIN/MAX保存极值"""
+    columns = []
+    for j, aggregate in enumerate(spec["aggregates"]):
+        func = aggregate["func"]
+        if func in ("SUM", "AVG"):
+            columns.append(f"a{j}_sum")
+        if func in ("COUNT", "AVG"):
+            columns.append(f"a{j}_cnt")
+        if func in ("MIN", "MAX"):
+            columns.append(f"a{j}_{func.lower()}")
+    return columns
+
+def aggregate_select(spec, source):
+    """从source（基表或增量临时表）计算汇总行的SELECT语句"""
+    select = [f"`{group}` AS g{k}" for k, group in enumerate(spec["groups"])]
+    for j, aggregate in enumerate(spec["aggregates"]):
+        func = aggregate["func"]
+        arg = "*" if aggregate["arg"] == "*" else f"`{aggregate['arg']}`"
+        if func in ("SUM", "AVG"):
+            select.append(f"SUM({arg}) AS a{j}_sum")
+        if func in ("COUNT", "AVG"):
+            select.append(f"COUNT({arg}) AS a{j}_cnt")
+        if func in ("MIN", "MAX"):
+            select.append(f"{func}({arg}) AS a{j}_{func.lower()}")
+    sql = f"SELECT {', '.join(select)} FROM `{source}`"
+    if spec["where"]:
+        sql += f" WHERE {spec['where']}"
+    return sql + " GROUP BY " + ", ".join(f"`{group}`" for group in spec["groups"])
+
+def merge_assignment(column):
+    """增量合并到已有汇总行的ON DUPLICATE KEY UPDATE表达式（正确处理NULL）"""
+    if column.endswith("_cnt"):
+        return f"`{column}` = `{column}` + VALUES(`{column}`)"
+    if column.endswith("_sum"):
+        return (f"`{column}` = IF(`{column}` IS NULL, VALUES(`{column}`), "
+                f"IF(VALUES(`{column}`) IS NULL, `{column}`, `{column}` + VALUES(`{column}`)))")
+    func = "LEAST" if column.endswith("_min") else "GREATEST"
+    return f"`{column}` = {func}(COALESCE(`{column}`, VALUES(`{column}`)), COALESCE(VALUES(`{column}`), `{column}`))"
+
+def reaggregate_expression(spec, func, arg):
+    """汇总表上重新聚合得到原查询结果的表达式"""
+    j = spec["aggregates"].index({"func": func, "arg": arg})
+    if func == "COUNT":
+        return f"SUM(a{j}_cnt)"
+    if func == "SUM":
+        return f"SUM(a{j}_sum)"
+    if func == "AVG":
+        return f"SUM(a{j}_sum) / SUM(a{j}_cnt)"
+    return f"{func}(a{j}_{func.lower()})"
+
+def rewrite_to_summary(parsed, spec):
+    """将聚合查询改写为读取汇总表，ORDER BY无法对应到输出列时返回None"""
+    group_index = {group.lower(): k for k, group in enumerate(spec["groups"])}
+    select, outputs = [], {}
+    for item in parsed["items"]:
+        if item["kind"] == "group":
+            expr = f"g{group_index[item['column'].lower()]}"
+        else:
+            expr = reaggregate_expression(spec, item["func"], item["arg"])
+        select.append(f"{expr} AS {_quote_label(item['label'])}")
+        outputs[_normalize(item["expr"]).lower()] = _quote_label(item["label"])
+        outputs[_normalize(item["label"]).lower()] = _quote_label(item["label"])
+    sql = (f"SELECT {', '.join(select)} FROM `{spec['summary_table']}` GROUP BY "
+           + ", ".join(f"g{k}" for k in range(len(spec["groups"]))))
+    if parsed["order"]:
+        terms = []
+        for term in split_top_level(parsed["order"]):
+            direction = DIRECTION_PATTERN.search(term)
+            expr = _normalize(DIRECTION_PATTERN.sub("", term)).strip("`").lower()
+            if expr in outputs:
+                target = outputs[expr]
+            elif expr.split(".")[-1].strip("`") in group_index:
+                target = f"g{group_index[expr.split('.')[-1].strip('`')]}"
+            else:
+                return None
+            terms.append(f"{target} {direction.group(1).upper()}" if direction else target)
+        sql += " ORDER BY " + ", ".join(terms)
+    if parsed["limit"]:
+        sql += f" LIMIT {parsed['limit']}"
+    return sql
+
+class SummaryTableManager:
+    """为高频聚合查询维护物化汇总表
+
+    作为query observer统计聚合SQL的执行次数，达到阈值后在后台建立汇总表，
+    并登记到内部注册表中（多个进程共享）。insert_from_df追加数据时在同一事务中
+    把增量聚合合并进汇总表，upsert或其他写语句则将汇总表标记为过期并全量刷新。
+    作为query rewriter将匹配的查询透明改写为读取汇总表。
+    """
+    def __init__(self, min_hits=SUMMARY_TABLE_MIN_HITS, max_tables=SUMMARY_TABLE_MAX):
+        self.min_hits = min_hits
+        self.max_tables = max_tables
+        # 建表/刷新和读取注册表分别使用独立的主库连接
+        self.db_manager = DatabaseManager(replica_configs=[])
+        self.registry_db = DatabaseManager(replica_configs=[])
+        # 命中次数和建表标记保存在共享存储中，多个worker共同计数
+        self.store = get_shared_store()
+        self._build_lock = threading.Lock()
+        self._registry_lock = threading.Lock()
+        # 可用于改写的汇总表：summary_id -> spec
+        self._ready = {}
+        self._loaded_at = 0.0
+        self._registry_ready = False
+
+    def _connection(self, manager):
+        if not manager.mysql_conn or not manager.mysql_conn.open:
+            manager.connect_mysql()
+        return manager.mysql_conn
+
+    def ensure_registry(self):
+        """创建汇总表注册表"""
+        if self._registry_ready:
+            return True
+        try:
+            with self._registry_lock:
+                conn = self._connection(self.registry_db)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        CREATE TABLE IF NOT EXISTS `{SUMMARY_REGISTRY_TABLE}` (
+                            summary_id CHAR(16) PRIMARY KEY,
+                            base_table VARCHAR(64),
+                            summary_table VARCHAR(64),
+                            spec TEXT,
+                            status VARCHAR(16),
+                            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                            refreshed_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                            KEY idx_base_table (base_table)
+                        )
+                    """)
+                conn.commit()
+            self._registry_ready = True
+        except Exception as e:
+            logger.error(f"Error creating summary table registry: {e}")
+        return self._registry_ready
+
+    def _load_ready(self):
+        """定期从注册表加载可用的汇总表，其他进程建立的汇总表也能被使用"""
+        if time.time() - self._loaded_at < SUMMARY_TABLE_REGISTRY_TTL:
+            return self._ready
+        with self._registry_lock:
+            conn = self._connection(self.registry_db)
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT summary_id, spec FROM `{SUMMARY_REGISTRY_TABLE}` WHERE status = 'ready'")
+                rows = cursor.fetchall()
+            conn.commit()
+        self._ready = {summary_id: json.loads(spec) for summary_id, spec in rows}
+        self._loaded_at = time.time()
+        return self._ready
+
+    def rewrite(self, query):
+        """query rewriter：命中汇总表时改写查询"""
+        if not self._registry_ready:
+            return query
+        parsed = parse_aggregate_query(query)
+        if not parsed:
+            return query
+        spec = self._load_ready().get(summary_id(parsed))
+        if not spec:
+            return query
+        rewritten = rewrite_to_summary(parsed, spec)
+        if not rewritten:
+            return query
+        logger.info(f"Rewrote aggregate query to summary table {spec['summary_table']}: {rewritten}")
+        return rewritten
+
+    def record(self, query, elapsed, session=None):
+        """query observer：统计聚合查询，达到阈值后在后台建立汇总表"""
+        parsed = parse_aggregate_query(query)
+        if not parsed:
+            return
+        key = summary_id(parsed)
+        hits = self.store.incr("summary_hits", key)
+        if hits < self.min_hits or key in self._ready:
+            return
+        # 同一张汇总表同时只由一个worker建立
+        if not self.store.add("summary_build_claims", key, os.getpid(), ttl=SUMMARY_BUILD_CLAIM_TTL):
+            return
+        threading.Thread(target=self._build, args=(key, parsed), name="summary-table-build", daemon=True).start()
+
+    def _build(self, key, parsed):
+        spec = {
+            "summary_id": key,
+            "base_table": parsed["base_table"],
+            "summary_table": f"{SUMMARY_TABLE_PREFIX}{key}",
+            "where": parsed["where"],
+            "groups": parsed["groups"],
+            "aggregates": parsed["aggregates"]
+        }
+        try:
+            if not self.ensure_registry():
+                return
+            with self._build_lock:
+                conn = self._connection(self.db_manager)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SELECT status FROM `{SUMMARY_REGISTRY_TABLE}` WHERE summary_id = %s", (key,))
+                    existing = cursor.fetchone()
+                    if existing and existing[0] == "ready":
+                        return
+                    cursor.execute(f"SELECT COUNT(*) FROM `{SUMMARY_REGISTRY_TABLE}`")
+                    if not existing and cursor.fetchone()[0] >= self.max_tables:
+                        logger.info(f"Summary table limit {self.max_tables} reached, skipping {key}")
+                        return
+                    # 建表期间的写入会把状态改为stale，建完后再全量刷新一次
+                    cursor.execute(f"""
+                        INSERT INTO `{SUMMARY_REGISTRY_TABLE}` (summary_id, base_table, summary_table, spec, status)
+                        VALUES (%s, %s, %s, %s, 'building')
+                        ON DUPLICATE KEY UPDATE status = 'building', spec = VALUES(spec)
+                    """, (key, spec["base_table"], spec["summary_table"], json.dumps(spec)))
+                    conn.commit()
+                    cursor.execute(f"DROP TABLE IF EXISTS `{spec['summary_table']}`")
+                    cursor.execute(
+                        f"CREATE TABLE `{spec['summary_table']}` AS {aggregate_select(spec, spec['base_table'])}"
+                    )
+                    try:
+                        group_list = ", ".join(f"g{k}" for k in range(len(spec["groups"])))
+                        cursor.execute(f"ALTER TABLE `{spec['summary_table']}` ADD UNIQUE KEY uk_groups ({group_list})")
+                    except Exception as e:
+                        # 分组列无法建唯一索引时增量行直接追加，读取时重新聚合仍然正确
+                        logger.info(f"Summary table {spec['summary_table']} without unique key: {e}")
+                self._refresh(key, only_if_stale=True)
+            logger.info(f"Built summary table {spec['summary_table']} for {spec['base_table']}")
+        except Exception as e:
+            logger.error(f"Error building summary table for {parsed['base_table']}: {e}")
+        finally:
+            self.store.reset_counter("summary_hits", key)
+            self.store.delete("summary_build_claims", key)
+            self._loaded_at = 0.0
+
+    def _refresh(self, key, only_if_stale=False):
+        """锁定注册表行后全量重算汇总表，期间的追加写入会等待"""
+        conn = self._connection(self.db_manager)
+        try:
+            conn.begin()
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT spec, status FROM `{SUMMARY_REGISTRY_TABLE}` WHERE summary_id = %s FOR UPDATE", (key,)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    conn.rollback()
+                    return
+                spec, status = json.loads(row[0]), row[1]
+                if not only_if_stale or status == "stale":
+                    cursor.execute(f"DELETE FROM `{spec['summary_table']}`")
+                    cursor.execute(
+                        f"INSERT INTO `{spec['summary_table']}` {aggregate_select(spec, spec['base_table'])}"
+                    )
+                cursor.execute(
+                    f"UPDATE `{SUMMARY_REGISTRY_TABLE}` SET status = 'ready' WHERE summary_id = %s", (key,)
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error refreshing summary table {key}, dropping it: {e}")
+            self._drop(key)
+
+    def _drop(self, key):
+        conn = self._connection(self.db_manager)
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS `{SUMMARY_TABLE_PREFIX}{key}`")
+            cursor.execute(f"DELETE FROM `{SUMMARY_REGISTRY_TABLE}` WHERE summary_id = %s", (key,))
+        conn.commit()
+        self._ready.pop(key, None)
+
+    def _refresh_stale(self, keys, only_if_stale=True):
+        with self._build_lock:
+            for key in keys:
+                self._refresh(key, only_if_stale=only_if_stale)
+        self._loaded_at = 0.0
+
+    def on_write(self, event):
+        """write observer：维护受影响的汇总表
+
+        在写入事务中执行，出错时异常向上抛出使整个写入回滚，基表与汇总表保持一致；
+        同时在后台全量刷新（失败则删除）相关汇总表，避免损坏的汇总表导致之后的写入一直失败。
+        """
+        if not self._registry_ready:
+            return
+        if event["mode"] == "statement":
+            self._on_statement(event["statement"])
+            return
+        cursor = event["cursor"]
+        table_name = event["table_name"]
+        # 在写入事务中锁定注册表行，与建表/刷新串行
+        cursor.execute(
+            f"SELECT summary_id, spec, status FROM `{SUMMARY_REGISTRY_TABLE}` WHERE base_table = %s FOR UPDATE",
+            (table_name,)
+        )
+        entries = [(key, json.loads(spec), status) for key, spec, status in cursor.fetchall()]
+        if not entries:
+            return
+        try:
+            if event["mode"] == "upsert":
+                # 已有行可能被更新，无法增量合并
+                for key, spec, status in entries:
+                    cursor.execute(f"DELETE FROM `{spec['summary_table']}`")
+                    cursor.execute(f"INSERT INTO `{spec['summary_table']}` {aggregate_select(spec, table_name)}")
+                return
+            self._merge_delta(cursor, table_name, event, entries)
+        except Exception as e:
+            keys = [key for key, spec, status in entries]
+            logger.error(f"Error maintaining summary tables {keys} for {table_name}, rolling back the write: {e}")
+            for key in keys:
+                self._ready.pop(key, None)
+            threading.Thread(
+                target=self._refresh_stale, args=(keys, False), name="summary-table-refresh", daemon=True
+            ).start()
+            raise
+
+    def _merge_delta(self, cursor, table_name, event, entries):
+        """把追加的行聚合后合并进汇总表"""
+        delta_table = f"{INTERNAL_TABLE_PREFIX}delta_{table_name}"[:64]
+        column_list = ", ".join(f"`{col}`" for col in event["columns"])
+        placeholders = ", ".join(["%s"] * len(event["columns"]))
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{delta_table}`")
+        cursor.execute(f"CREATE TEMPORARY TABLE `{delta_table}` LIKE `{table_name}`")
+        try:
+            cursor.executemany(f"INSERT INTO `{delta_table}` ({column_list}) VALUES ({placeholders})", event["rows"])
+            for key, spec, status in entries:
+                if status != "ready":
+                    self._mark_stale(cursor, key)
+                    continue
+                columns = [f"g{k}" for k in range(len(spec["groups"]))] + summary_columns(spec)
+                cursor.execute(f"""
+                    INSERT INTO `{spec['summary_table']}` ({', '.join(columns)})
+                    {aggregate_select(spec, delta_table)}
+                    ON DUPLICATE KEY UPDATE {', '.join(merge_assignment(col) for col in summary_columns(spec))}
+                """)
+        finally:
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{delta_table}`")
+
+    def _mark_stale(self, cursor, key):
+        cursor.execute(f"UPDATE `{SUMMARY_REGISTRY_TABLE}` SET status = 'stale' WHERE summary_id = %s", (key,))
+        self._ready.pop(key, None)
+        threading.Thread(target=self._refresh_stale, args=([key],), name="summary-table-refresh", daemon=True).start()
+
+    def _on_statement(self, statement):
+        """其他写语句（UPDATE/DELETE/DROP等）涉及基表时标记汇总表过期并后台刷新"""
+        if IGNORED_STATEMENT_PATTERN.match(statement):
+            return
+        with self._registry_lock:
+            conn = self._connection(self.registry_db)
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT summary_id, base_table FROM `{SUMMARY_REGISTRY_TABLE}`")
+                keys = [
+                    key for key, base_table in cursor.fetchall()
+                    if re.search(rf"(?<![\w$]){re.escape(base_table)}(?![\w$])", statement, re.IGNORECASE)
+                ]
+                for key in keys:
+                    cursor.execute(
+                        f"UPDATE `{SUMMARY_REGISTRY_TABLE}` SET status = 'stale' WHERE summary_id = %s", (key,)
+                    )
+            conn.commit()
+        for key in keys:
+            self._ready.pop(key, None)
+        if keys:
+            threading.Thread(target=self._refresh_stale, args=(keys,), name="summary-table-refresh", daemon=True).start()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# 测试只覆盖纯函数，日志和共享存储写到临时目录，不需要/app目录
+_tmp_dir = tempfile.mkdtemp(prefix="chatdb_tests_")
+os.environ.setdefault("LOG_DIR", os.path.join(_tmp_dir, "logs"))
+os.environ.setdefault("SHARED_STORE_PATH", os.path.join(_tmp_dir, "chatdb_shared.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
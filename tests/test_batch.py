@@ -0,0 +1,61 @@
+import json
+import pytest
+import batch
+from batch import _percentile
+from batch import load_questions
+
+def write_lines(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+def test_load_questions(tmp_path):
+    path = write_lines(tmp_path / "questions.jsonl", [
+        json.dumps({"question": "有多少部电影？", "expected_sql": "SELECT COUNT(*) FROM movies"}, ensure_ascii=False),
+        "",
+        json.dumps("评分最高的电影是哪部？", ensure_ascii=False),
+        json.dumps({"id": "q3", "question": "你好", "db_type": "MySQL"}, ensure_ascii=False),
+    ])
+    questions = load_questions(path)
+    assert questions == [
+        {"question": "有多少部电影？", "expected_sql": "SELECT COUNT(*) FROM movies", "id": 1},
+        {"question": "评分最高的电影是哪部？", "id": 3},
+        {"id": "q3", "question": "你好", "db_type": "MySQL"},
+    ]
+
+@pytest.mark.parametrize("line, message", [
+    ("{not json", "第1行不是合法的JSON"),
+    (json.dumps({"id": 1}), "第1行缺少question"),
+    (json.dumps({"question": "  "}), "第1行缺少question"),
+    (json.dumps([1, 2]), "第1行缺少question"),
+])
+def test_load_questions_rejects_invalid_lines(tmp_path, line, message):
+    path = write_lines(tmp_path / "questions.jsonl", [line])
+    with pytest.raises(ValueError, match=message):
+        load_questions(path)
+
+def test_percentile():
+    assert _percentile([], 50) is None
+    assert _percentile([3.0], 95) == 3.0
+    values = [5, 1, 4, 2, 3]
+    assert _percentile(values, 50) == 3
+    assert _percentile(values, 0) == 1
+    assert _percentile(values, 100) == 5
+    assert _percentile(list(range(1, 101)), 95) == 95
+
+def test_main_returns_2_for_bad_input(tmp_path, capsys):
+    path = write_lines(tmp_path / "questions.jsonl", ["{not json"])
+    assert batch.main([path]) == 2
+    assert "读取问题文件失败" in capsys.readouterr().err
+
+@pytest.mark.parametrize("args, use_cache", [([], True), (["--no-cache"], False)])
+def test_main_passes_cache_flag(tmp_path, monkeypatch, args, use_cache):
+    path = write_lines(tmp_path / "questions.jsonl", [json.dumps({"question": "q"})])
+    calls = []
+
+    def run_batch(questions, output, concurrency, db_type, use_cache):
+        calls.append((output, use_cache))
+        return {"questions": 1, "statuses": {"ok": 1}}
+
+    monkeypatch.setattr(batch, "run_batch", run_batch)
+    assert batch.main([path] + args) == 0
+    assert calls == [(str(tmp_path / "questions.results.jsonl"), use_cache)]
@@ -0,0 +1,72 @@
+import time
+import pytest
+from cancellation import CancelScope
+from cancellation import QueryCancelled
+from cancellation import QueryTimeout
+from cancellation import cancel_session
+from cancellation import finish_request
+from cancellation import start_request
+
+def test_check_passes_within_budget():
+    scope = CancelScope(timeout=10)
+    try:
+        scope.check()
+        assert 9 < scope.remaining() <= 10
+    finally:
+        scope.close()
+
+def test_scope_without_timeout_has_no_deadline():
+    scope = CancelScope()
+    scope.check()
+    assert scope.remaining() is None
+
+def test_stage_deadline_raises_timeout():
+    scope = CancelScope()
+    with pytest.raises(QueryTimeout, match="Stage"):
+        scope.check(time.monotonic() - 1)
+
+def test_timeout_cancels_scope_and_runs_callbacks():
+    scope = CancelScope(timeout=0.05)
+    called = []
+    scope.add_callback(lambda: called.append("kill"))
+    time.sleep(0.2)
+    assert scope.cancelled
+    assert called == ["kill"]
+    with pytest.raises(QueryTimeout):
+        scope.check()
+
+def test_cancel_runs_registered_callbacks_once():
+    scope = CancelScope()
+    called = []
+    handle = scope.add_callback(lambda: called.append("removed"))
+    scope.add_callback(lambda: called.append("kept"))
+    scope.remove_callback(handle)
+    scope.cancel("client disconnected")
+    scope.cancel("again")
+    assert called == ["kept"]
+    with pytest.raises(QueryCancelled, match="client disconnected") as exc:
+        scope.check()
+    assert not isinstance(exc.value, QueryTimeout)
+
+def test_failing_callback_does_not_stop_others():
+    scope = CancelScope()
+    called = []
+    scope.add_callback(lambda: 1 / 0)
+    scope.add_callback(lambda: called.append("kill"))
+    scope.cancel()
+    assert called == ["kill"]
+
+def test_new_request_supersedes_previous_one():
+    first = start_request("test-session")
+    second = start_request("test-session")
+    assert first.cancelled and "superseded" in first.reason
+    assert not second.cancelled
+    finish_request("test-session", second)
+    # 已结束的请求不再被取消
+    cancel_session("test-session")
+    assert not second.cancelled
+
+def test_cancel_session():
+    scope = start_request("test-cancel-session")
+    cancel_session("test-cancel-session", "stopped")
+    assert scope.cancelled and scope.reason == "stopped"
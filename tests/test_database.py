@@ -0,0 +1,57 @@
+import pytest
+from database import DatabaseManager
+from database import apply_max_execution_time
+from database import statement_keyword
+
+@pytest.mark.parametrize("query, keyword", [
+    ("SELECT 1", "select"),
+    ("  select * from movies", "select"),
+    ("-- 注释\nSELECT 1", "select"),
+    ("/* hint */ (SELECT 1) UNION (SELECT 2)", "select"),
+    ("WITH t AS (SELECT * FROM movies) SELECT * FROM t", "select"),
+    ("WITH a AS (SELECT 1), b AS (SELECT ') update (' FROM a) SELECT * FROM b", "select"),
+    ("WITH t AS (SELECT id FROM movies) DELETE FROM movies WHERE id IN (SELECT id FROM t)", "delete"),
+    ("DESC movies", "desc"),
+    ("INSERT INTO movies VALUES (1)", "insert"),
+    ("", None),
+])
+def test_statement_keyword(query, keyword):
+    assert statement_keyword(query)[0] == keyword
+
+@pytest.mark.parametrize("query, is_read", [
+    ("SELECT * FROM movies", True),
+    ("WITH t AS (SELECT 1) SELECT * FROM t", True),
+    ("SHOW TABLES", True),
+    ("DESCRIBE movies", True),
+    ("EXPLAIN SELECT * FROM movies", True),
+    ("SELECT * FROM movies FOR UPDATE", False),
+    ("SELECT * FROM movies LOCK IN SHARE MODE", False),
+    ("SELECT * FROM movies INTO OUTFILE '/tmp/x'", False),
+    ("UPDATE movies SET year = 2000", False),
+    ("WITH t AS (SELECT 1) UPDATE movies SET year = 2000", False),
+])
+def test_is_read_query(query, is_read):
+    assert DatabaseManager.is_read_query(query) is is_read
+
+def test_is_write_query():
+    assert DatabaseManager.is_write_query("CREATE TABLE t (id INT)")
+    assert DatabaseManager.is_write_query("WITH t AS (SELECT 1) DELETE FROM movies")
+    assert not DatabaseManager.is_write_query("SELECT * FROM movies")
+    assert not DatabaseManager.is_write_query("SET @a = 1")
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM movies", "SELECT /*+ MAX_EXECUTION_TIME(500) */ * FROM movies"),
+    ("-- c\nselect 1", "-- c\nselect /*+ MAX_EXECUTION_TIME(500) */ 1"),
+    (
+        "WITH t AS (SELECT 1) SELECT * FROM t",
+        "WITH t AS (SELECT 1) SELECT /*+ MAX_EXECUTION_TIME(500) */ * FROM t"
+    ),
+    ("SELECT /*+ MAX_EXECUTION_TIME(100) */ 1", "SELECT /*+ MAX_EXECUTION_TIME(100) */ 1"),
+    ("SHOW TABLES", "SHOW TABLES"),
+    ("UPDATE movies SET year = 2000", "UPDATE movies SET year = 2000"),
+])
+def test_apply_max_execution_time(query, expected):
+    assert apply_max_execution_time(query, 500) == expected
+
+def test_apply_max_execution_time_disabled():
+    assert apply_max_execution_time("SELECT 1", 0) == "SELECT 1"
@@ -0,0 +1,85 @@
+from index_advisor import extract_index_candidates
+from index_advisor import index_name
+
+def test_equality_columns_precede_first_range_column():
+    candidates = extract_index_candidates(
+        "SELECT * FROM orders WHERE created_at > '2024-01-01' AND status = 'paid' AND customer_id = 3"
+    )
+    assert candidates[0] == (("orders",), ("status", "customer_id", "created_at"))
+
+def test_join_columns_resolve_aliases():
+    candidates = extract_index_candidates(
+        "SELECT * FROM orders o JOIN customers c ON o.customer_id = c.id "
+        "WHERE o.status = 'paid' ORDER BY o.created_at"
+    )
+    assert candidates == [
+        (("orders",), ("status",)),
+        (("orders",), ("customer_id",)),
+        (("customers",), ("id",)),
+        (("orders",), ("created_at",)),
+    ]
+
+def test_group_by_columns_are_candidates():
+    assert extract_index_candidates("SELECT genre, COUNT(*) FROM movies WHERE year = 2000 GROUP BY genre") == [
+        (("movies",), ("year",)),
+        (("movies",), ("genre",)),
+    ]
+
+def test_literals_are_not_columns():
+    candidates = extract_index_candidates("SELECT * FROM movies WHERE title = 'a = b' AND year = 2000")
+    assert candidates == [(("movies",), ("title", "year"))]
+
+def test_queries_without_tables_have_no_candidates():
+    assert extract_index_candidates("SELECT 1") == []
+
+def test_index_name_fits_mysql_identifier_limit():
+    assert index_name(["status", "created_at"]) == "idx_chatdb_status_created_at"
+    long_name = index_name(["a" * 40, "b" * 40])
+    assert len(long_name) == 64
+    assert long_name != index_name(["a" * 40, "b" * 41])
+
+def make_advisor(monkeypatch, mode, benefits):
+    """替换数据库相关方法，只测试每轮的评估次数和排序"""
+    import index_advisor
+    advisor = index_advisor.IndexAdvisor(mode=mode)
+    ranked = [
+        (("movies", (column,)), {"count": 10, "total_latency": latency, "queries": [f"SELECT * FROM movies WHERE {column} = 1"]})
+        for column, latency in [("a", 10.0), ("b", 8.0), ("c", 6.0), ("d", 4.0)]
+    ]
+    evaluated, applied, dropped = [], [], []
+
+    def evaluate(table, columns, stats):
+        evaluated.append(columns[0])
+        return {
+            "table_name": table, "columns": list(columns), "index_name": index_name(columns),
+            "query_count": stats["count"], "total_latency": stats["total_latency"],
+            "benefit": benefits[columns[0]], "applied": False
+        }
+
+    monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_MAX_EVALUATIONS", 3)
+    monkeypatch.setattr(index_advisor, "INDEX_ADVISOR_TOP_N", 1)
+    monkeypatch.setattr(advisor, "_ranked_candidates", lambda: ranked)
+    monkeypatch.setattr(advisor, "_existing_indexes", lambda table: {})
+    monkeypatch.setattr(advisor, "_evaluate", evaluate)
+    monkeypatch.setattr(advisor, "_apply", lambda rec: applied.append(rec["columns"][0]))
+    monkeypatch.setattr(advisor, "_discard", lambda rec: dropped.append(rec["columns"][0]))
+    return advisor, evaluated, applied, dropped
+
+def test_analyze_limits_evaluations_and_ranks_by_benefit(monkeypatch):
+    advisor, evaluated, applied, dropped = make_advisor(
+        monkeypatch, "apply", {"a": 0.25, "b": 0.9, "c": 0.1, "d": 0.9}
+    )
+    results = advisor.analyze()
+    # 只评估累计耗时最高的3个候选，c的收益低于阈值
+    assert evaluated == ["a", "b", "c"]
+    # b：0.9×8 > a：0.25×10，只有b被设为可见，a的不可见索引被删除
+    assert [rec["columns"] for rec in results] == [["b"]]
+    assert applied == ["b"]
+    assert dropped == ["a"]
+
+def test_evaluate_mode_never_applies(monkeypatch):
+    advisor, evaluated, applied, dropped = make_advisor(
+        monkeypatch, "evaluate", {"a": 0.5, "b": 0.5, "c": 0.5, "d": 0.5}
+    )
+    assert [rec["columns"] for rec in advisor.analyze()] == [["a"]]
+    assert applied == [] and dropped == []
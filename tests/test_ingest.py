@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from database import DatabaseManager
+from database import normalize_column_name
+
+def values(*items):
+    # 与insert_from_df一致：NaN已被替换为None
+    return pd.Series(list(items), dtype=object)
+
+@pytest.mark.parametrize("name", ["OrderId", "order_id", "Order ID", "order-id", " ORDER_ID "])
+def test_normalize_column_name(name):
+    assert normalize_column_name(name) == "orderid"
+
+def test_watermark_type_ignores_nulls():
+    assert DatabaseManager._watermark_type(values(99, None, 100)) == "numeric"
+    assert DatabaseManager._watermark_type(values("2024-01-02", None, "2024-01-10")) == "string"
+    assert DatabaseManager._watermark_type(values(None, None)) is None
+
+def test_watermark_value_is_numeric_max_despite_nulls():
+    assert DatabaseManager._watermark_value(values(99, None, 100)) == 100
+    assert DatabaseManager._watermark_value(values("9", "10")) == 10
+
+def test_watermark_value_uses_stored_type():
+    assert DatabaseManager._watermark_value(values("2024-01-02", "2024-01-10", None), "string") == "2024-01-10"
+    assert DatabaseManager._watermark_value(values(None, None)) is None
+
+def test_beyond_watermark_compares_numbers_and_skips_nulls():
+    beyond = DatabaseManager._beyond_watermark(values(99, None, 100, 101), "100", "numeric")
+    assert beyond.tolist() == [False, False, False, True]
+
+def test_beyond_watermark_rejects_text_in_numeric_watermark():
+    with pytest.raises(ValueError):
+        DatabaseManager._beyond_watermark(values(101, "n/a"), "100", "numeric")
+
+def test_beyond_watermark_compares_strings():
+    beyond = DatabaseManager._beyond_watermark(values("2024-01-01", None, "2024-02-01"), "2024-01-15", "string")
+    assert beyond.tolist() == [False, False, True]
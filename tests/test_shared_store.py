@@ -0,0 +1,68 @@
+import multiprocessing
+import time
+import pytest
+import shared_store
+from shared_store import SharedStore
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedStore(str(tmp_path / "store" / "shared.db"))
+
+def test_get_set_round_trips_json(store):
+    store.set("cache", "k", {"rows": [1, 2], "name": "电影"})
+    assert store.get("cache", "k") == {"rows": [1, 2], "name": "电影"}
+    assert store.get("cache", "missing", "default") == "default"
+    assert store.get("other", "k") is None
+
+def test_expired_values_are_not_returned(store):
+    store.set("cache", "k", "v", ttl=0.05)
+    assert store.get("cache", "k") == "v"
+    time.sleep(0.1)
+    assert store.get("cache", "k") is None
+
+def test_add_only_succeeds_once_until_expired(store):
+    assert store.add("claims", "k", 1, ttl=0.05)
+    assert not store.add("claims", "k", 2)
+    time.sleep(0.1)
+    assert store.add("claims", "k", 3)
+    assert store.get("claims", "k") == 3
+
+def test_delete_key_and_namespace(store):
+    store.set("cache", "a", 1)
+    store.set("cache", "b", 2)
+    store.delete("cache", "a")
+    assert store.get("cache", "a") is None and store.get("cache", "b") == 2
+    store.delete("cache")
+    assert store.get("cache", "b") is None
+
+def test_counters(store):
+    assert store.incr("metrics", "questions") == 1
+    assert store.incr("metrics", "seconds", 0.5) == 0.5
+    assert store.incr("metrics", "questions", 2) == 3
+    assert store.counter("metrics", "questions") == 3
+    assert store.counter("metrics", "missing") == 0
+    assert store.counters("metrics") == {"questions": 3, "seconds": 0.5}
+    store.reset_counter("metrics", "questions")
+    assert store.counters("metrics") == {"seconds": 0.5}
+
+def test_set_purges_expired_keys_periodically(store, monkeypatch):
+    store.set("cache", "old", "v", ttl=0.01)
+    time.sleep(0.05)
+    monkeypatch.setattr(shared_store, "PURGE_INTERVAL", 0)
+    store.set("cache", "new", "v")
+    rows = store._conn().execute("SELECT key FROM kv WHERE namespace = 'cache'").fetchall()
+    assert rows == [("new",)]
+
+def _incr_many(path, count):
+    store = SharedStore(path)
+    for _ in range(count):
+        store.incr("metrics", "shared")
+
+def test_counters_are_shared_between_processes(store):
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_incr_many, args=(store.path, 50)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    assert store.counter("metrics", "shared") == 150
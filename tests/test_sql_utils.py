@@ -0,0 +1,39 @@
+import pymysql
+import pytest
+from sql_utils import add_columns_to_table
+
+class FakeDatabaseManager:
+    """记录执行的语句，ALGORITHM=INSTANT时返回指定的错误"""
+    def __init__(self, instant_error=None):
+        self.instant_error = instant_error
+        self.statements = []
+
+    def execute_mysql_query(self, query):
+        self.statements.append(" ".join(query.split()))
+        if "ALGORITHM=INSTANT" in query and self.instant_error:
+            raise pymysql.err.OperationalError(self.instant_error, "instant not supported")
+        return "Query executed successfully. Affected rows: 0"
+
+def test_adds_all_columns_in_one_instant_statement():
+    db_manager = FakeDatabaseManager()
+    assert add_columns_to_table("movies", ["budget", "tagline"], ["float64", "object"], db_manager=db_manager)
+    assert db_manager.statements == [
+        "ALTER TABLE `movies` ADD COLUMN `budget` FLOAT, ADD COLUMN `tagline` VARCHAR(255) , ALGORITHM=INSTANT"
+    ]
+
+@pytest.mark.parametrize("code", [1800, 1845, 1846, 4092])
+def test_falls_back_when_instant_is_not_supported(code):
+    db_manager = FakeDatabaseManager(instant_error=code)
+    assert add_columns_to_table("movies", ["budget"], ["float64"], db_manager=db_manager)
+    assert db_manager.statements[-1] == "ALTER TABLE `movies` ADD COLUMN `budget` FLOAT"
+
+def test_other_errors_are_raised():
+    db_manager = FakeDatabaseManager(instant_error=1060)
+    with pytest.raises(pymysql.err.OperationalError):
+        add_columns_to_table("movies", ["budget"], ["float64"], db_manager=db_manager)
+    assert len(db_manager.statements) == 1
+
+def test_no_columns_is_a_no_op():
+    db_manager = FakeDatabaseManager()
+    assert add_columns_to_table("movies", [], [], db_manager=db_manager)
+    assert db_manager.statements == []
@@ -0,0 +1,145 @@
+import sqlite3
+import pytest
+from summary_tables import aggregate_select
+from summary_tables import merge_assignment
+from summary_tables import parse_aggregate_query
+from summary_tables import rewrite_to_summary
+from summary_tables import split_top_level
+from summary_tables import summary_id
+
+def make_spec(parsed):
+    return {
+        "summary_id": summary_id(parsed),
+        "base_table": parsed["base_table"],
+        "summary_table": "_chatdb_summary_test",
+        "where": parsed["where"],
+        "groups": parsed["groups"],
+        "aggregates": parsed["aggregates"]
+    }
+
+def test_split_top_level_ignores_nested_and_quoted_separators():
+    assert split_top_level("a, f(b, c), 'x,y', `d,e`") == ["a", "f(b, c)", "'x,y'", "`d,e`"]
+
+def test_parse_strips_qualifiers_and_keeps_labels():
+    parsed = parse_aggregate_query(
+        "SELECT m.genre AS g, COUNT(*) AS n, AVG(m.rating) FROM movies m "
+        "WHERE m.year >= 2000 GROUP BY m.genre ORDER BY n DESC LIMIT 5"
+    )
+    assert parsed["base_table"] == "movies"
+    assert parsed["where"] == "year >= 2000"
+    assert parsed["groups"] == ["genre"]
+    assert parsed["aggregates"] == [{"func": "AVG", "arg": "rating"}, {"func": "COUNT", "arg": "*"}]
+    assert [item["label"] for item in parsed["items"]] == ["g", "n", "AVG(m.rating)"]
+    assert parsed["order"] == "n DESC"
+    assert parsed["limit"] == "5"
+
+@pytest.mark.parametrize("query", [
+    "SELECT genre, COUNT(*) FROM movies",
+    "SELECT m.genre, COUNT(*) FROM movies m JOIN ratings r ON r.movie_id = m.id GROUP BY m.genre",
+    "SELECT genre, COUNT(*) FROM movies GROUP BY genre HAVING COUNT(*) > 1",
+    "SELECT genre, COUNT(DISTINCT director) FROM movies GROUP BY genre",
+    "SELECT genre, COUNT(*) FROM (SELECT * FROM movies) t GROUP BY genre",
+    "SELECT genre, year, COUNT(*) FROM movies GROUP BY genre",
+    "SELECT YEAR(release_date), COUNT(*) FROM movies GROUP BY YEAR(release_date)",
+    "SELECT genre, SUM(price * quantity) FROM movies GROUP BY genre",
+    "SELECT genre, COUNT(*) FROM movies GROUP BY genre WITH ROLLUP",
+    "SELECT table_name, COUNT(*) FROM _chatdb_ingest_manifest GROUP BY table_name",
+    "SELECT genre, COUNT(*) FROM movies WHERE release_date > NOW() - INTERVAL 7 DAY GROUP BY genre",
+    "SELECT genre, COUNT(*) FROM movies WHERE release_date >= CURRENT_DATE GROUP BY genre",
+    "SELECT genre, COUNT(*) FROM movies WHERE RAND() < 0.1 GROUP BY genre",
+    "SELECT genre, COUNT(*) FROM movies WHERE year = @year GROUP BY genre",
+])
+def test_parse_rejects_unsupported_shapes(query):
+    assert parse_aggregate_query(query) is None
+
+def test_parse_accepts_function_names_inside_string_literals():
+    parsed = parse_aggregate_query(
+        "SELECT genre, COUNT(*) FROM movies WHERE title = 'now' AND email <> 'a@b.com' GROUP BY genre"
+    )
+    assert parsed is not None
+    assert parsed["where"] == "title = 'now' AND email <> 'a@b.com'"
+
+def test_summary_id_ignores_labels_select_order_and_qualifiers():
+    first = parse_aggregate_query("SELECT genre, COUNT(*) AS n, SUM(gross) FROM movies GROUP BY genre")
+    second = parse_aggregate_query(
+        "SELECT SUM(m.gross) AS total, m.genre, COUNT(*) FROM movies AS m GROUP BY m.genre ORDER BY total"
+    )
+    other_filter = parse_aggregate_query(
+        "SELECT genre, COUNT(*), SUM(gross) FROM movies WHERE year > 2000 GROUP BY genre"
+    )
+    assert summary_id(first) == summary_id(second)
+    assert summary_id(first) != summary_id(other_filter)
+
+def test_rewrite_reaggregates_and_maps_order_by_labels():
+    parsed = parse_aggregate_query(
+        "SELECT m.genre AS g, COUNT(*) AS n, AVG(m.rating) FROM movies m "
+        "WHERE m.year >= 2000 GROUP BY m.genre ORDER BY n DESC LIMIT 5"
+    )
+    assert rewrite_to_summary(parsed, make_spec(parsed)) == (
+        "SELECT g0 AS `g`, SUM(a1_cnt) AS `n`, SUM(a0_sum) / SUM(a0_cnt) AS `AVG(m.rating)` "
+        "FROM `_chatdb_summary_test` GROUP BY g0 ORDER BY `n` DESC LIMIT 5"
+    )
+
+@pytest.mark.parametrize("order, expected", [
+    ("COUNT(*) DESC", "`n` DESC"),
+    ("n", "`n`"),
+    ("genre ASC", "g0 ASC"),
+    ("m.genre", "`g`"),
+])
+def test_rewrite_maps_order_by_expressions(order, expected):
+    parsed = parse_aggregate_query(
+        f"SELECT m.genre AS g, COUNT(*) AS n FROM movies m GROUP BY m.genre ORDER BY {order}"
+    )
+    assert rewrite_to_summary(parsed, make_spec(parsed)).endswith(f"ORDER BY {expected}")
+
+def test_rewrite_orders_by_group_column_not_in_select():
+    parsed = parse_aggregate_query("SELECT COUNT(*) AS n FROM movies GROUP BY genre ORDER BY genre")
+    assert rewrite_to_summary(parsed, make_spec(parsed)).endswith("GROUP BY g0 ORDER BY g0")
+
+def test_rewrite_rejects_order_by_unknown_expression():
+    parsed = parse_aggregate_query("SELECT genre, COUNT(*) FROM movies GROUP BY genre ORDER BY rating")
+    assert rewrite_to_summary(parsed, make_spec(parsed)) is None
+
+def test_merge_assignment_keeps_existing_values_when_delta_is_null():
+    assert merge_assignment("a0_cnt") == "`a0_cnt` = `a0_cnt` + VALUES(`a0_cnt`)"
+    assert merge_assignment("a0_sum") == (
+        "`a0_sum` = IF(`a0_sum` IS NULL, VALUES(`a0_sum`), "
+        "IF(VALUES(`a0_sum`) IS NULL, `a0_sum`, `a0_sum` + VALUES(`a0_sum`)))"
+    )
+    assert merge_assignment("a1_min") == (
+        "`a1_min` = LEAST(COALESCE(`a1_min`, VALUES(`a1_min`)), COALESCE(VALUES(`a1_min`), `a1_min`))"
+    )
+    assert merge_assignment("a2_max").startswith("`a2_max` = GREATEST(")
+
+def test_rewritten_query_matches_base_table_with_null_groups():
+    """汇总表由多批增量（包括NULL分组和NULL值）累积而成，改写后的结果与直接查询基表一致"""
+    query = (
+        "SELECT genre AS g, COUNT(*) AS n, COUNT(rating) AS rated, SUM(rating) AS total, "
+        "AVG(rating) AS avg_rating, MIN(rating), MAX(rating) FROM movies "
+        "WHERE year >= 2000 GROUP BY genre ORDER BY g"
+    )
+    parsed = parse_aggregate_query(query)
+    spec = make_spec(parsed)
+    batches = [
+        [("drama", 2001, 7.5), ("drama", 2005, None), (None, 2010, 6.0), ("comedy", 1990, 9.0)],
+        [("drama", 2020, 8.5), (None, 2011, None), ("horror", 2015, None), ("comedy", 2003, 5.0)],
+    ]
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE movies (genre TEXT, year INTEGER, rating REAL)")
+    conn.execute("CREATE TABLE delta (genre TEXT, year INTEGER, rating REAL)")
+    for k, batch in enumerate(batches):
+        conn.execute("DELETE FROM delta")
+        conn.executemany("INSERT INTO delta VALUES (?, ?, ?)", batch)
+        conn.executemany("INSERT INTO movies VALUES (?, ?, ?)", batch)
+        if k == 0:
+            conn.execute(f"CREATE TABLE `{spec['summary_table']}` AS {aggregate_select(spec, 'delta')}")
+        else:
+            # 没有唯一键时增量行直接追加，读取时重新聚合
+            conn.execute(f"INSERT INTO `{spec['summary_table']}` {aggregate_select(spec, 'delta')}")
+
+    expected = conn.execute(query).fetchall()
+    actual = conn.execute(rewrite_to_summary(parsed, spec)).fetchall()
+    assert actual == expected
+    assert actual[0] == (None, 2, 1, 6.0, 6.0, 6.0, 6.0)
+    assert actual[-1] == ("horror", 1, 0, None, None, None, None)